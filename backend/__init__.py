@@ -1 +1,3 @@
 __author__ = 'Ivana'
+
+default_app_config = 'backend.apps.BackendConfig'
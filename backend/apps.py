@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class BackendConfig(AppConfig):
+    name = 'backend'
+    verbose_name = 'Pegula'
+
+    def ready(self):
+        # connect signal handlers
+        from . import signals  # noqa
+        from . import db
+        db.connect_signals()
@@ -0,0 +1,76 @@
+import logging
+import pickle
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import ugettext_lazy as _
+
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from .cache import LRUCache
+
+
+__all__ = 'CachedTokenAuthentication', 'invalidate_tokens'
+
+log = logging.getLogger(__name__)
+
+
+_local_cache = None
+
+
+def get_token_cache():
+    """The shared Django cache named by `TOKEN_AUTH_CACHE_ALIAS`, or else a per-process LRU"""
+    global _local_cache
+    alias = getattr(settings, 'TOKEN_AUTH_CACHE_ALIAS', None)
+    if alias:
+        return caches[alias]
+    if _local_cache is None:
+        _local_cache = LRUCache(maxsize=getattr(settings, 'TOKEN_AUTH_CACHE_SIZE', 10000),
+                                timeout=getattr(settings, 'TOKEN_AUTH_CACHE_TIMEOUT', 60))
+    return _local_cache
+
+
+def _cache_key(key):
+    return 'authtoken:%s' % key
+
+
+def invalidate_tokens(*keys):
+    """Evict token keys from the authentication cache, e.g. when a token is deleted or its user changes"""
+    cache = get_token_cache()
+    for key in keys:
+        cache.delete(_cache_key(key))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """DRF `TokenAuthentication` which caches the Token + User lookup instead of querying on every request
+
+    The token (with its user) is cached pickled, so every request gets its own fresh instances and the
+    same value can live in a shared cache. Entries are evicted by the signal handlers in `backend.signals`
+    when a token is deleted or its user is saved (e.g. deactivated), and otherwise expire after
+    `TOKEN_AUTH_CACHE_TIMEOUT` seconds.
+    """
+
+    def authenticate_credentials(self, key):
+        if isinstance(key, bytes):
+            key = key.decode('latin-1')
+
+        cache = get_token_cache()
+        cached = cache.get(_cache_key(key))
+        if cached is not None:
+            token = pickle.loads(cached)
+        else:
+            try:
+                # a token created moments ago (by logging in) may not have reached the read replicas yet
+                token = self.model.objects.using(DEFAULT_DB_ALIAS).select_related('user').get(key=key)
+            except self.model.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            if token.user.is_active:
+                cache.set(_cache_key(key), pickle.dumps(token, pickle.HIGHEST_PROTOCOL),
+                          getattr(settings, 'TOKEN_AUTH_CACHE_TIMEOUT', 60))
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        return (token.user, token)
@@ -0,0 +1,155 @@
+"""Several API calls in one HTTP request, see `backend.views.BatchView`
+
+Sub-requests are dispatched straight to the resolved view, skipping the middleware, and are authenticated
+as the batch request itself: its user and token are forced onto every sub-request (as DRF's test client
+does), so credentials are checked once.
+
+With `parallel`, a batch of GET/HEAD sub-requests runs on a thread pool of `BATCH_MAX_WORKERS` threads
+shared by the process, which under uWSGI needs `enable-threads` (see conf/uwsgi.ini). Their database
+connections are per thread and kept for reuse, subject to `CONN_MAX_AGE` like the request threads' own.
+Batches with writes always run in order, one at a time.
+"""
+import io
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.urlresolvers import Resolver404, resolve, reverse
+from django.db import close_old_connections
+from django.utils.translation import ugettext as _
+
+from rest_framework.exceptions import ValidationError
+
+from .replicas import SAFE_METHODS
+
+
+__all__ = 'parse_batch', 'run_batch'
+
+log = logging.getLogger(__name__)
+
+METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE')
+RESPONSE_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Location', 'Allow')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'BATCH_MAX_WORKERS', 4))
+        return _executor
+
+
+def _api_prefix():
+    return reverse('v1:api-root').rstrip('/')
+
+
+def parse_batch(data):
+    """Validate `{"requests": [...], "parallel": false}`, or just the list; returns `(items, parallel)`"""
+    parallel = False
+    if isinstance(data, dict):
+        parallel = bool(data.get('parallel'))
+        data = data.get('requests')
+    if not isinstance(data, list) or not data:
+        raise ValidationError({'requests': [_('Expected a non-empty list of requests.')]})
+    max_requests = getattr(settings, 'BATCH_MAX_REQUESTS', 20)
+    if len(data) > max_requests:
+        raise ValidationError({'requests': [_('At most %d requests per batch.') % max_requests]})
+
+    items, errors = [], []
+    for item in data:
+        error = {}
+        if not isinstance(item, dict):
+            item, error = {}, {'non_field_errors': [_('Expected an object with `method` and `path`.')]}
+        elif str(item.get('method', 'GET')).upper() not in METHODS:
+            error['method'] = [_('Must be one of %s.') % ', '.join(METHODS)]
+        elif not isinstance(item.get('path'), str) or not item['path']:
+            error['path'] = [_('This field is required.')]
+        elif not isinstance(item.get('headers', {}), dict):
+            error['headers'] = [_('Expected an object.')]
+        errors.append(error)
+        items.append(dict(item, method=str(item.get('method', 'GET')).upper()))
+    if any(errors):
+        raise ValidationError(errors)
+    return items, parallel
+
+
+def build_request(parent, method, path, body=None, headers=None):
+    """A `WSGIRequest` for `method path` carrying `parent`'s environment and authentication"""
+    path, _sep, query = path.partition('?')
+    data = json.dumps(body).encode('utf-8') if body is not None else b''
+    environ = {key: value for key, value in parent.META.items()
+               if not key.startswith('HTTP_IF_') and key not in ('CONTENT_TYPE', 'CONTENT_LENGTH')}
+    for name, value in (headers or {}).items():
+        environ['HTTP_' + name.upper().replace('-', '_')] = str(value)
+    environ['HTTP_ACCEPT'] = 'application/json'  # sub-responses are embedded in the JSON of the batch one
+    environ.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(data)),
+        'wsgi.input': io.BytesIO(data),
+    })
+    request = WSGIRequest(environ)
+    request._force_auth_user = parent.user
+    request._force_auth_token = parent.auth
+    return request
+
+
+def dispatch(parent, item):
+    """Run one sub-request, returning `{status, headers, body}`"""
+    method = item['method']
+    path = item['path']
+    prefix = _api_prefix()
+    if not path.startswith(prefix + '/'):
+        path = prefix + '/' + path.lstrip('/')
+
+    try:
+        match = resolve(path.partition('?')[0])
+    except Resolver404:
+        match = None
+    if match is None or match.namespace != 'v1' or match.url_name == 'batch-list':
+        return {'status': 404, 'headers': {}, 'body': {'detail': _('Not found.')}}
+
+    request = build_request(parent, method, path, item.get('body'), item.get('headers'))
+    request.resolver_match = match
+    try:
+        response = match.func(request, *match.args, **match.kwargs)
+        if hasattr(response, 'render') and callable(response.render):
+            response.render()
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        content = content.decode(response.charset or 'utf-8') or None
+        if content and response.get('Content-Type', '').startswith('application/json'):
+            content = json.loads(content)
+    except Exception:
+        log.exception('Batch sub-request %s %s failed', method, path)
+        return {'status': 500, 'headers': {}, 'body': {'detail': _('Server error.')}}
+
+    return {
+        'status': response.status_code,
+        'headers': {name: response[name] for name in RESPONSE_HEADERS if response.has_header(name)},
+        'body': content,
+    }
+
+
+def _dispatch_in_thread(parent, item):
+    # pool threads don't see the request signals which look after the connections of request threads
+    close_old_connections()
+    try:
+        return dispatch(parent, item)
+    finally:
+        close_old_connections()
+
+
+def run_batch(parent, items, parallel=False):
+    """Responses to `items`, in their order"""
+    if parallel and len(items) > 1 and all(item['method'] in SAFE_METHODS for item in items):
+        executor = _get_executor()
+        return list(executor.map(lambda item: _dispatch_in_thread(parent, item), items))
+    return [dispatch(parent, item) for item in items]
@@ -0,0 +1,120 @@
+import io
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+
+
+__all__ = 'LRUCache', 'ExpiringFileBasedCache', 'get_response_cache', 'get_cache_version', 'bump_cache_version', 'seconds_since_bump'
+
+
+class LRUCache(object):
+    """Small thread-safe, in-process LRU cache whose entries also expire after `timeout` seconds
+
+    Follows the `get`/`set`/`delete` subset of Django's cache API so callers can swap in a shared
+    `django.core.cache.caches[...]` backend. Keep in mind that it is per-process: with several uWSGI
+    workers, invalidating an entry only reaches the worker that did it, so `timeout` bounds staleness.
+    """
+
+    def __init__(self, maxsize=1024, timeout=60):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return default
+            if expires < time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        expires = time.time() + (self.timeout if timeout is None else timeout)
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ExpiringFileBasedCache(FileBasedCache):
+    """`FileBasedCache` which, once `MAX_ENTRIES` is reached, deletes the expired entries before culling
+
+    Django's deletes a random `1 / CULL_FREQUENCY` of the entries instead, live or not, and expired files
+    otherwise stay until they are read again. Short-lived entries like `backend.replicas`' sticky markers
+    would pile up and have live ones culled with them.
+    """
+
+    def _cull(self):
+        filelist = self._list_cache_files()
+        if len(filelist) < self._max_entries:
+            return
+        for fname in filelist:
+            try:
+                with io.open(fname, 'rb') as f:
+                    self._is_expired(f)  # deletes the file if it is
+            except (IOError, EOFError):
+                pass  # removed or being replaced by another process
+        super(ExpiringFileBasedCache, self)._cull()
+
+
+#
+# Versioned API response cache
+#
+
+def get_response_cache():
+    """The Django cache holding rendered API responses, named by `API_RESPONSE_CACHE_ALIAS`"""
+    return caches[getattr(settings, 'API_RESPONSE_CACHE_ALIAS', 'default')]
+
+
+def _version_key(namespace):
+    return 'api:%s:version' % namespace
+
+
+def get_cache_version(namespace):
+    """Current version token of `namespace`; every cached response key embeds it"""
+    cache = get_response_cache()
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        cache.add(_version_key(namespace), uuid.uuid4().hex, None)
+        version = cache.get(_version_key(namespace))
+    return version
+
+
+def bump_cache_version(namespace):
+    """Orphan every cached response in `namespace`, which then age out of the cache on their own
+
+    Versions are random tokens rather than an incrementing counter, so an evicted version key can never
+    bring old entries back to life.
+    """
+    get_response_cache().set_many({
+        _version_key(namespace): uuid.uuid4().hex,
+        'api:%s:bumped' % namespace: time.time(),
+    }, None)
+
+
+def seconds_since_bump(namespace):
+    """Seconds since `namespace` was last bumped, or None if not known"""
+    bumped = get_response_cache().get('api:%s:bumped' % namespace)
+    return None if bumped is None else time.time() - bumped
@@ -0,0 +1,139 @@
+"""Delta sync: Users, Employees and Clients changed since an opaque token
+
+A token holds, per resource, the `(modified, pk)` of the last row handed out, plus the position in the
+`Tombstone` table recording deleted rows. Each poll walks those keysets forward (backed by the
+`(modified, id)` indexes) and returns the changed rows, the keys of deactivated or deleted ones, and the
+token to poll with next. Polling without a token starts from the beginning, which doubles as the initial load.
+
+Rows only enter the feed `CHANGES_SETTLE_SECONDS` after they were modified: `modified` is stamped before the
+row's transaction commits (and before read replicas catch up), so a row can become visible after rows
+modified later than it, which the feed would otherwise have moved past.
+
+Tokens are signed and expire after `CHANGES_TOMBSTONE_DAYS`, when tombstones are pruned; a client holding an
+older token must reload everything.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.translation import ugettext_lazy as _
+
+from rest_framework import exceptions
+from rest_framework import status as http_status
+from rest_framework.compat import OrderedDict
+
+from .models import Client, Employee, Tombstone, User
+from .serializers import ClientSerializer, EmployeeFullSerializer, UserFullSerializer, prefetch_roles
+
+
+__all__ = 'RESOURCES', 'TokenExpired', 'get_changes', 'record_tombstone', 'prune_tombstones'
+
+SIGNING_SALT = 'backend.changes'
+
+RESOURCES = [
+    # resource, model, key field, serializer
+    ('users', User, 'email', UserFullSerializer),
+    ('employees', Employee, 'email', EmployeeFullSerializer),
+    ('clients', Client, 'id', ClientSerializer),
+]
+
+
+class TokenExpired(exceptions.APIException):
+    status_code = http_status.HTTP_410_GONE
+    default_detail = _('This sync token has expired, reload everything and poll without `since`.')
+
+
+def _retention():
+    return timedelta(days=getattr(settings, 'CHANGES_TOMBSTONE_DAYS', 30))
+
+
+def encode_token(positions):
+    return signing.dumps(positions, salt=SIGNING_SALT, compress=True)
+
+
+def decode_token(token):
+    try:
+        positions = signing.loads(token, salt=SIGNING_SALT, max_age=_retention().total_seconds())
+    except signing.SignatureExpired:
+        raise TokenExpired()
+    except signing.BadSignature:
+        raise exceptions.ValidationError({'since': [_('Invalid sync token.')]})
+    # e.g. signed by a server whose clock is ahead: polling with it would skip the rows in between
+    now = timezone.now()
+    if any(parse_datetime(moment) > now for moment, pk in positions.values()):
+        raise exceptions.ValidationError({'since': [_('Invalid sync token.')]})
+    return positions
+
+
+def _after(queryset, field, position):
+    """Rows after `position`, a `[timestamp, pk]` pair, in `(field, pk)` order"""
+    if position is not None:
+        moment, pk = parse_datetime(position[0]), position[1]
+        queryset = queryset.filter(Q(**{field + '__gt': moment}) | Q(**{field: moment, 'pk__gt': pk}))
+    return queryset.order_by(field, 'pk')
+
+
+def _is_active(model, instance):
+    active_filter = getattr(model.objects, 'active_filter', {})
+    return all(getattr(instance, name) == value for name, value in active_filter.items())
+
+
+def get_changes(request, token=None):
+    positions = decode_token(token) if token else {}
+    page_size = getattr(settings, 'CHANGES_PAGE_SIZE', 500)
+    until = timezone.now() - timedelta(seconds=getattr(settings, 'CHANGES_SETTLE_SECONDS', 5))
+    more = False
+
+    changed, deleted = {}, {resource: {} for resource, model, key, serializer_class in RESOURCES}
+    tombstones = list(_after(Tombstone.objects.filter(deleted__lte=until), 'deleted',
+                             positions.get('tombstones'))[:page_size + 1])
+    more |= len(tombstones) > page_size
+    for tombstone in tombstones[:page_size]:
+        deleted[tombstone.resource][tombstone.key] = tombstone.deleted
+        positions['tombstones'] = [tombstone.deleted.isoformat(), tombstone.pk]
+
+    for resource, model, key, serializer_class in RESOURCES:
+        queryset = getattr(model, 'all_objects', model.objects).filter(modified__lte=until)
+        if model is User:
+            queryset = queryset.prefetch_related(prefetch_roles())
+        rows = list(_after(queryset, 'modified', positions.get(resource))[:page_size + 1])
+        more |= len(rows) > page_size
+        rows = rows[:page_size]
+        if rows:
+            positions[resource] = [rows[-1].modified.isoformat(), rows[-1].pk]
+
+        active = []
+        for row in rows:
+            row_key = getattr(row, key)
+            if row_key in deleted[resource] and deleted[resource][row_key] > row.modified:
+                continue  # changed, then deleted
+            deleted[resource].pop(row_key, None)  # deleted, then created again
+            if _is_active(model, row):
+                active.append(row)
+            else:
+                deleted[resource][row_key] = row.modified
+        changed[resource] = serializer_class(active, many=True, context={'request': request}).data
+
+    return OrderedDict([
+        ('changed', changed),
+        ('deleted', {resource: sorted(keys) for resource, keys in deleted.items()}),
+        ('since', encode_token(positions)),
+        ('more', more),
+    ])
+
+
+def record_tombstone(model, instance):
+    for resource, resource_model, key, serializer_class in RESOURCES:
+        if resource_model is model:
+            Tombstone.objects.create(resource=resource, key=getattr(instance, key))
+
+
+def prune_tombstones():
+    """Delete tombstones older than any unexpired token could need; returns how many were deleted"""
+    tombstones = Tombstone.objects.filter(deleted__lt=timezone.now() - _retention())
+    count = tombstones.count()
+    tombstones.delete()
+    return count
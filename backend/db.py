@@ -0,0 +1,74 @@
+"""Health-checked reuse of persistent database connections
+
+Django already keeps connections open between requests for `CONN_MAX_AGE` seconds (the lifetime cap) and
+only drops them early after a database error. What it doesn't do is notice a connection the server side
+killed while it sat idle (a PostgreSQL restart, an idle timeout in a proxy), which then fails the next
+request. Before a request may reuse a connection that has been idle longer than `DB_HEALTH_CHECK_IDLE`
+seconds, we ping it with `is_usable()` and close it if dead, so Django transparently opens a fresh one.
+
+Per-process counters of opened, reused and discarded connections are kept in `stats`, and each request's
+opens are reported by `backend.middleware.QueryInstrumentationMiddleware`.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.signals import request_started, request_finished
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from . import instrumentation
+
+
+__all__ = 'stats', 'connect_signals'
+
+log = logging.getLogger(__name__)
+
+# process-wide counters: opened, reused, unhealthy
+stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _count(key):
+    with _stats_lock:
+        stats[key] += 1
+
+
+def connection_opened(sender, connection, **kwargs):
+    _count('opened')
+    request_stats = instrumentation.current_stats()
+    if request_stats is not None:
+        request_stats.connections_opened = getattr(request_stats, 'connections_opened', 0) + 1
+    log.debug('Opened database connection %r (%s)', connection.alias, dict(stats))
+
+
+def check_connections(**kwargs):
+    """`request_started` handler: ping connections that sat idle too long, drop the dead ones"""
+    idle_limit = getattr(settings, 'DB_HEALTH_CHECK_IDLE', 30)
+    now = time.time()
+    for conn in connections.all():
+        if conn.connection is None:
+            continue
+        if now - getattr(conn, '_pegula_last_used', now) > idle_limit and not conn.is_usable():
+            _count('unhealthy')
+            log.warning('Discarding dead database connection %r', conn.alias)
+            conn.close()
+        else:
+            _count('reused')
+
+
+def mark_connections_used(**kwargs):
+    now = time.time()
+    for conn in connections.all():
+        if conn.connection is not None:
+            conn._pegula_last_used = now
+
+
+def connect_signals():
+    # Django's own `close_old_connections` is connected to these at import time, so it runs first and has
+    # already closed connections past `CONN_MAX_AGE` or left broken by errors
+    connection_created.connect(connection_opened, dispatch_uid='backend.db.connection_opened')
+    request_started.connect(check_connections, dispatch_uid='backend.db.check_connections')
+    request_finished.connect(mark_connections_used, dispatch_uid='backend.db.mark_connections_used')
@@ -0,0 +1,91 @@
+import csv
+import json
+from datetime import datetime, date
+
+from django.http import StreamingHttpResponse
+
+
+__all__ = 'EXPORT_FORMATS', 'iter_chunks', 'iter_queryset_chunks', 'stream_export'
+
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def iter_chunks(queryset, fields, chunk_size=2000):
+    """Yield lists of `(pk, field1, field2, ...)` tuples, `chunk_size` rows at a time
+
+    Rather than relying on `.iterator()`, which with psycopg2 still buffers the whole result client-side,
+    we walk the primary key with keyset queries (`pk > last ORDER BY pk LIMIT n`) so that memory stays
+    bounded by `chunk_size` and each chunk costs the same index seek.
+    """
+    queryset = queryset.prefetch_related(None).order_by('pk').values_list('pk', *fields)
+    chunk = list(queryset[:chunk_size])
+    while chunk:
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+        chunk = list(queryset.filter(pk__gt=chunk[-1][0])[:chunk_size])
+
+
+def iter_queryset_chunks(queryset, chunk_size=500):
+    """Yield lists of up to `chunk_size` rows (instances or `values()` dicts) of `queryset`, in its order
+
+    Unordered querysets are walked by primary key like `iter_chunks()` does; ordered ones (e.g. search results
+    by rank) have to be sliced with OFFSET instead.
+    """
+    pk = queryset.model._meta.pk
+    ordered = queryset.ordered
+    if not ordered:
+        queryset = queryset.order_by('pk')
+    chunk = list(queryset[:chunk_size])
+    offset = 0
+    while chunk:
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+        if ordered:
+            offset += chunk_size
+            chunk = list(queryset[offset:offset + chunk_size])
+        else:
+            last = chunk[-1]
+            chunk = list(queryset.filter(pk__gt=last[pk.attname] if isinstance(last, dict) else last.pk)
+                         [:chunk_size])
+
+
+def _to_text(value):
+    if isinstance(value, datetime):
+        value = value.isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value  # same as DRF's ISO 8601 output
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+class _Echo(object):
+    """File-like object which hands back whatever `csv.writer` writes, so we can yield it"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_lines(header, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow([';'.join(v) if isinstance(v, (list, tuple)) else _to_text(v) for v in row])
+
+
+def _ndjson_lines(header, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(header, row)), default=_to_text) + '\n'
+
+
+def stream_export(rows, header, fmt, filename):
+    """Build a `StreamingHttpResponse` writing `rows` (tuples matching `header`) as CSV or NDJSON"""
+    lines = _csv_lines(header, rows) if fmt == 'csv' else _ndjson_lines(header, rows)
+    response = StreamingHttpResponse(lines, content_type=EXPORT_FORMATS[fmt])
+    response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (filename, fmt)
+    return response
@@ -0,0 +1,107 @@
+"""Read-only list serialization straight from `QuerySet.values()` rows
+
+`ModelSerializer` builds a model instance per row and then walks `field.get_attribute()` and
+`field.to_representation()` for every field of it. For plain columns we can instead fetch the rows as dicts,
+and map them through a per-field plan compiled from the very same serializer fields, which keeps the output
+identical to `serializer.data` while skipping model instantiation and attribute lookups.
+"""
+import logging
+from collections import OrderedDict
+
+from rest_framework import fields as drf_fields
+from rest_framework.relations import ManyRelatedField, RelatedField, SlugRelatedField
+
+
+__all__ = 'compile_plan', 'RowPlan'
+
+log = logging.getLogger(__name__)
+
+
+# DRF fields whose `to_representation()` is the identity for values the database hands back
+# (e.g. `CharField` returns `six.text_type(value)`, and column values are already text)
+IDENTITY_FIELDS = (drf_fields.CharField, drf_fields.EmailField, drf_fields.SlugField)
+
+
+class RowPlan(object):
+    """A compiled serializer: which columns to fetch and how to turn each `values()` row into its output"""
+
+    # m2m relations are fetched for at most this many parent rows per query
+    related_batch_size = 500
+
+    def __init__(self, model, columns, related):
+        self.model = model
+        self.columns = columns  # [(output name, column, converter or None)], in output order; column None if related
+        self.related = related  # [(output name, m2m model field, slug field)]
+
+    @property
+    def fetch(self):
+        """Names to pass to `QuerySet.values()`"""
+        names = [column for name, column, convert in self.columns if column is not None]
+        if self.related:
+            names.append(self.model._meta.pk.name)
+        return names
+
+    def serialize(self, rows):
+        rows = list(rows)
+        related = {name: self.fetch_related(rows, field, slug) for name, field, slug in self.related}
+        pk = self.model._meta.pk.name
+
+        data = []
+        for row in rows:
+            item = OrderedDict()
+            for name, column, convert in self.columns:
+                if column is None:
+                    item[name] = related[name].get(row[pk], [])
+                    continue
+                value = row[column]
+                item[name] = value if value is None or convert is None else convert(value)
+            data.append(item)
+        return data
+
+    def fetch_related(self, rows, field, slug):
+        """Map parent pk -> list of related slugs for `rows`, in slug order"""
+        through = field.rel.through
+        source, target = field.m2m_field_name(), field.m2m_reverse_field_name()
+        pks = [row[self.model._meta.pk.name] for row in rows]
+
+        values = {}
+        for start in range(0, len(pks), self.related_batch_size):
+            links = through.objects.filter(**{'%s__in' % source: pks[start:start + self.related_batch_size]}) \
+                .order_by('%s__%s' % (target, slug), 'pk').values_list('%s_id' % source, '%s__%s' % (target, slug))
+            for parent, value in links:
+                values.setdefault(parent, []).append(value)
+        return values
+
+
+def compile_plan(serializer):
+    """Compile a `RowPlan` from a `ModelSerializer` instance, or return None if it can't be done
+
+    Only fields sourced directly from a concrete model column, or `many=True` `SlugRelatedField`s over a
+    many-to-many, are supported. Anything else (method fields, dotted sources, nested serializers, ...)
+    makes the caller fall back to the regular serializer.
+    """
+    fields = [(name, field) for name, field in serializer.fields.items() if not field.write_only]
+    return _compile(serializer.Meta.model, fields)
+
+
+def _compile(model, fields):
+    concrete = {f.name: f for f in model._meta.concrete_fields}
+    columns, related = [], []
+
+    for name, field in fields:
+        if isinstance(field, ManyRelatedField):
+            child = field.child_relation
+            m2m = {f.name: f for f in model._meta.many_to_many}.get(field.source)
+            if type(child) is not SlugRelatedField or m2m is None:
+                return None
+            columns.append((name, None, None))
+            related.append((name, m2m, child.slug_field))
+        elif isinstance(field, (RelatedField, drf_fields.SerializerMethodField)) or field.source not in concrete:
+            return None
+        elif concrete[field.source].rel is not None:
+            return None  # foreign keys would need `<name>_id` mapping, not used by our serializers
+        else:
+            convert = None if type(field) in IDENTITY_FIELDS else field.to_representation
+            columns.append((name, field.source, convert))
+
+    return RowPlan(model, columns, related)
@@ -0,0 +1,127 @@
+import logging
+
+from django.db import connections
+
+from rest_framework.filters import BaseFilterBackend, SearchFilter
+
+from .serializers import requested_fields
+
+
+__all__ = 'IndexedSearchFilter', 'SparseFieldsFilter'
+
+log = logging.getLogger(__name__)
+
+
+# The trigram tokenizer / pg_trgm can only use the index for terms of at least this many characters
+MIN_TRIGRAM_TERM = 3
+
+
+def fts_table_name(db_table):
+    """Name of the SQLite FTS5 shadow table maintained for `db_table` (see migration 0004)"""
+    return '%s_fts' % db_table
+
+
+class IndexedSearchFilter(SearchFilter):
+    """Drop-in replacement for DRF's `SearchFilter` which is served from a substring index and ranks results
+
+    Keeps the `?search=` API and semantics (every term must match at least one of `search_fields`), but
+    instead of an `icontains` OR-chain, which can't use a b-tree index and so scans the table:
+
+    - PostgreSQL: `ILIKE` against the `pg_trgm` GIN indexes, ranked by trigram `similarity()`
+    - SQLite: `MATCH` against the FTS5 trigram shadow table, ranked by FTS5's bm25 `rank`
+
+    Falls back to the stock `SearchFilter` whenever the index can't answer the query: other databases,
+    a missing FTS5 table, prefixed (`^`, `=`, `@`) search fields, or terms shorter than a trigram.
+    """
+
+    # per-alias cache of FTS5 shadow tables present in the SQLite database
+    _fts_tables = {}
+
+    def filter_queryset(self, request, queryset, view):
+        search_fields = getattr(view, 'search_fields', None)
+        terms = self.get_search_terms(request)
+        if not search_fields or not terms:
+            return queryset
+
+        if any(f[0] in '^=@' for f in search_fields) or any(len(t) < MIN_TRIGRAM_TERM for t in terms):
+            return super(IndexedSearchFilter, self).filter_queryset(request, queryset, view)
+
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql':
+            return self.filter_trigram(connection, queryset, search_fields, terms)
+        if connection.vendor == 'sqlite' and self.has_fts_table(connection, queryset.model):
+            return self.filter_fts(connection, queryset, search_fields, terms)
+        return super(IndexedSearchFilter, self).filter_queryset(request, queryset, view)
+
+    def filter_trigram(self, connection, queryset, search_fields, terms):
+        columns = self._columns(connection, queryset.model, search_fields)
+
+        where, params = [], []
+        for term in terms:
+            where.append('(%s)' % ' OR '.join('%s ILIKE %%s' % c for c in columns))
+            params.extend(['%%%s%%' % _escape_like(term)] * len(columns))
+
+        rank = 'GREATEST(%s)' % ', '.join('similarity(%s, %%s)' % c for c in columns)
+        return queryset.extra(select={'search_rank': rank}, select_params=[' '.join(terms)] * len(columns),
+                              where=where, params=params, order_by=['-search_rank'])
+
+    def filter_fts(self, connection, queryset, search_fields, terms):
+        qn = connection.ops.quote_name
+        opts = queryset.model._meta
+        fts = qn(fts_table_name(opts.db_table))
+        columns = ' '.join(opts.get_field(f).column for f in search_fields)
+
+        # column filter + implicit AND of quoted terms: {email first_name} : ("foo" "bar")
+        match = '{%s} : (%s)' % (columns, ' '.join('"%s"' % t.replace('"', '""') for t in terms))
+        return queryset.extra(select={'search_rank': '%s.rank' % fts},
+                              tables=[fts_table_name(opts.db_table)],
+                              where=['%s.rowid = %s.%s' % (fts, qn(opts.db_table), qn(opts.pk.column)),
+                                     '%s MATCH %%s' % fts],
+                              params=[match], order_by=['search_rank'])
+
+    @classmethod
+    def has_fts_table(cls, connection, model):
+        tables = cls._fts_tables.get(connection.alias)
+        if tables is None:
+            with connection.cursor() as cursor:
+                tables = cls._fts_tables[connection.alias] = {
+                    t for t in connection.introspection.table_names(cursor) if t.endswith('_fts')}
+        return fts_table_name(model._meta.db_table) in tables
+
+    @staticmethod
+    def _columns(connection, model, search_fields):
+        qn = connection.ops.quote_name
+        opts = model._meta
+        return ['%s.%s' % (qn(opts.db_table), qn(opts.get_field(f).column)) for f in search_fields]
+
+
+class SparseFieldsFilter(BaseFilterBackend):
+    """Narrows the SQL to the columns a `?fields=` request will serialize (see `serializers.SparseFieldsMixin`)
+
+    Loads only the requested concrete columns, plus the primary key and the view's `keyset_ordering`
+    columns (which pagination reads), and drops `prefetch_related` lookups whose field wasn't asked for,
+    so e.g. `?fields=email,first_name` on users never touches `groups`.
+    """
+
+    # serializer field name -> model relation it is sourced from
+    related_sources = {'roles': 'groups'}
+
+    def filter_queryset(self, request, queryset, view):
+        fields = requested_fields(request)
+        if not fields:
+            return queryset
+
+        concrete = {f.name for f in queryset.model._meta.concrete_fields}
+        ordering = {o.lstrip('-') for o in getattr(view, 'keyset_ordering', ())}
+        queryset = queryset.only(*((fields & concrete) | (ordering & concrete) | {'pk'}))
+
+        wanted = {self.related_sources.get(f, f) for f in fields}
+        prefetch = [lookup for lookup in queryset._prefetch_related_lookups
+                    if getattr(lookup, 'prefetch_to', lookup).split('__')[0] in wanted]
+        if len(prefetch) != len(queryset._prefetch_related_lookups):
+            queryset = queryset.prefetch_related(None).prefetch_related(*prefetch)
+        return queryset
+
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
@@ -0,0 +1,103 @@
+"""Per-request SQL and timing instrumentation, collected by `backend.middleware.QueryInstrumentationMiddleware`
+
+Django 1.8 has no hook around query execution, so we swap each connection's cursor factories for ones
+returning timing cursor wrappers. This works whether or not `DEBUG` is on, and costs a couple of
+`time.time()` calls per query. Statistics go to a thread-local `RequestStats`, so queries run outside a
+request (management commands, migrations) are not recorded.
+"""
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db.backends.utils import CursorWrapper, CursorDebugWrapper
+
+
+__all__ = 'RequestStats', 'instrument_connection', 'start_request', 'finish_request', 'current_stats', 'timed'
+
+
+_local = threading.local()
+
+
+class RequestStats(object):
+    def __init__(self):
+        self.started = time.time()
+        self.queries = 0
+        self.db_time = 0.0
+        self.timers = Counter()
+        self.signatures = Counter()
+
+    def add_query(self, sql, duration, count=1):
+        self.queries += count
+        self.db_time += duration
+        self.signatures[sql] += 1
+
+    def duplicates(self, threshold):
+        """Statements which ran at least `threshold` times, most repeated first (likely N+1s)"""
+        return [(sql, n) for sql, n in self.signatures.most_common() if n >= threshold]
+
+
+def start_request():
+    _local.stats = RequestStats()
+    return _local.stats
+
+
+def finish_request():
+    stats, _local.stats = current_stats(), None
+    return stats
+
+
+def current_stats():
+    return getattr(_local, 'stats', None)
+
+
+@contextmanager
+def timed(name):
+    """Add the time spent in the block to the current request's `name` timer, if there is a request"""
+    stats = current_stats()
+    if stats is None:
+        yield
+        return
+    started = time.time()
+    try:
+        yield
+    finally:
+        stats.timers[name] += time.time() - started
+
+
+class _TimingMixin(object):
+
+    def execute(self, sql, params=None):
+        started = time.time()
+        try:
+            return super(_TimingMixin, self).execute(sql, params)
+        finally:
+            stats = current_stats()
+            if stats is not None:
+                stats.add_query(sql, time.time() - started)
+
+    def executemany(self, sql, param_list):
+        started = time.time()
+        try:
+            return super(_TimingMixin, self).executemany(sql, param_list)
+        finally:
+            stats = current_stats()
+            if stats is not None:
+                stats.add_query(sql, time.time() - started)
+
+
+class TimingCursorWrapper(_TimingMixin, CursorWrapper):
+    pass
+
+
+class TimingCursorDebugWrapper(_TimingMixin, CursorDebugWrapper):
+    pass
+
+
+def instrument_connection(connection):
+    """Make `connection` hand out timing cursors; safe to call repeatedly"""
+    if getattr(connection, '_pegula_instrumented', False):
+        return
+    connection.make_cursor = lambda cursor: TimingCursorWrapper(cursor, connection)
+    connection.make_debug_cursor = lambda cursor: TimingCursorDebugWrapper(cursor, connection)
+    connection._pegula_instrumented = True
@@ -0,0 +1,120 @@
+"""Outbound email through a database outbox
+
+`OutboxEmailBackend` is the `EMAIL_BACKEND`: sending an email (`User.email_user()`, password resets, ...)
+only inserts an `OutboxMessage`, in the request's own transaction, so a stalled SMTP server can't hold up
+the uWSGI workers. `manage.py send_outbox` delivers the queue through `OUTBOX_DELIVERY_BACKEND`.
+"""
+import logging
+import pickle
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboxMessage
+
+
+__all__ = 'OutboxEmailBackend', 'deliver_batch'
+
+log = logging.getLogger(__name__)
+
+SMTP_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+
+
+def _pickle(message):
+    connection, message.connection = message.connection, None  # the backend instance isn't picklable
+    try:
+        return pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+    finally:
+        message.connection = connection
+
+
+class OutboxEmailBackend(BaseEmailBackend):
+    """Email backend queueing messages in the `OutboxMessage` table instead of sending them"""
+
+    def send_messages(self, email_messages):
+        queued = [OutboxMessage(recipients=', '.join(message.recipients()), subject=message.subject[:255],
+                                message=_pickle(message))
+                  for message in email_messages if message.recipients()]
+        OutboxMessage.objects.bulk_create(queued)
+        return len(queued)
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next attempt: `OUTBOX_RETRY_DELAY`, doubled on every failed attempt"""
+    base = getattr(settings, 'OUTBOX_RETRY_DELAY', 60)
+    return min(base * 2 ** (attempts - 1), getattr(settings, 'OUTBOX_MAX_RETRY_DELAY', 3600))
+
+
+def _reschedule(row, error, max_attempts):
+    row.attempts += 1
+    row.last_error = '%s: %s' % (type(error).__name__, error)
+    row.send_after = timezone.now() + timedelta(seconds=retry_delay(row.attempts))
+    row.save(update_fields=('attempts', 'last_error', 'send_after'))
+    log.warning('Sending email %d to %s failed (attempt %d of %d): %s',
+                row.pk, row.recipients, row.attempts, max_attempts, row.last_error)
+
+
+def _postpone(rows, error):
+    # the server was unreachable: the messages themselves didn't fail, so this doesn't count as an attempt
+    last_error = '%s: %s' % (type(error).__name__, error)
+    OutboxMessage.objects.filter(pk__in=[row.pk for row in rows]).update(
+        last_error=last_error, send_after=timezone.now() + timedelta(seconds=retry_delay(1)))
+    log.warning('Could not connect to send %d emails, retrying in %ds: %s', len(rows), retry_delay(1), last_error)
+
+
+def _claim(batch_size, max_attempts):
+    # Lease the due rows by moving `send_after` past `OUTBOX_CLAIM_TIMEOUT`, so concurrent workers skip them
+    # without the row locks being held while talking to the server. Should this worker die mid-batch, its
+    # messages are picked up again once the lease runs out.
+    with transaction.atomic():
+        due = list(OutboxMessage.objects.select_for_update()
+                   .filter(send_after__lte=timezone.now(), attempts__lt=max_attempts).order_by('send_after', 'pk')
+                   [:batch_size])
+        lease = timedelta(seconds=getattr(settings, 'OUTBOX_CLAIM_TIMEOUT', 600))
+        OutboxMessage.objects.filter(pk__in=[row.pk for row in due]).update(send_after=timezone.now() + lease)
+    return due
+
+
+def deliver_batch(batch_size=100, max_attempts=5, backend=None):
+    """Send up to `batch_size` due messages over one connection; returns `(sent, failed)` counts
+
+    Sent messages are deleted, failed ones rescheduled with exponential backoff. After `max_attempts` a
+    message stays in the table with its `last_error` but is no longer picked up. When the server can't be
+    reached at all the batch is retried after `OUTBOX_RETRY_DELAY` without using up its attempts. The
+    messages are claimed in a short transaction of their own (see `_claim`) before any of them is sent.
+    """
+    due = _claim(batch_size, max_attempts)
+    connection = get_connection(backend or getattr(settings, 'OUTBOX_DELIVERY_BACKEND', SMTP_BACKEND))
+    sent, failed, is_open = [], 0, False
+    try:
+        for i, row in enumerate(due):
+            if not is_open:
+                try:
+                    connection.open()
+                except Exception as e:
+                    # there's no point in trying the rest of the batch
+                    _postpone(due[i:], e)
+                    failed += len(due) - i
+                    break
+                is_open = True
+            try:
+                message = pickle.loads(bytes(row.message))
+                message.connection = connection
+                message.send()
+            except Exception as e:
+                failed += 1
+                _reschedule(row, e, max_attempts)
+                # a dropped SMTP connection would fail every later message too, so reconnect
+                connection.close()
+                is_open = False
+            else:
+                sent.append(row.pk)
+    finally:
+        if is_open:
+            connection.close()
+    OutboxMessage.objects.filter(pk__in=sent).delete()
+    return len(sent), failed
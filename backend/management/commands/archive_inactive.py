@@ -0,0 +1,79 @@
+import json
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from backend.changes import prune_tombstones
+from backend.models import ArchivedRecord, Employee, User
+
+
+# model, natural key field, columns left out of the archived copy
+ARCHIVABLE = {
+    'users': (User, 'email', ('password',)),
+    'employees': (Employee, 'email', ()),
+}
+
+
+class Command(BaseCommand):
+    help = 'Move Users and Employees deactivated a long time ago to `ArchivedRecord`, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365,
+                            help='Archive rows deactivated (i.e. last modified) more than this many days ago '
+                                 '(default: 365)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows moved per transaction (default: 500)')
+        parser.add_argument('--only', choices=sorted(ARCHIVABLE), help='Archive only users or employees')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rows which would be archived')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        for label in [options['only']] if options['only'] else sorted(ARCHIVABLE):
+            model, key_field, excluded = ARCHIVABLE[label]
+            # `objects` knows what "active" means for the model, so everything else is deactivated
+            queryset = model.all_objects.exclude(**model.objects.active_filter).filter(modified__lt=cutoff)
+            if options['dry_run']:
+                self.stdout.write('DRY RUN: %d %s would be archived' % (queryset.count(), label))
+                continue
+
+            started, archived = time.time(), 0
+            while True:
+                moved = self.archive_batch(model, queryset, key_field, excluded, options['batch_size'])
+                if not moved:
+                    break
+                archived += moved
+            self.stdout.write('%d %s archived in %.1fs' % (archived, label, time.time() - started))
+
+        if not options['dry_run']:
+            # housekeeping for the `/changes` feed, whose tombstones the archived rows just added to
+            self.stdout.write('%d expired tombstones deleted' % prune_tombstones())
+
+    @transaction.atomic
+    def archive_batch(self, model, queryset, key_field, excluded, batch_size):
+        """Copy the next batch of rows to the archive and delete them; returns how many were moved"""
+        names = [f.attname for f in model._meta.concrete_fields if f.attname not in excluded]
+        rows = list(queryset.order_by('pk').values(*names)[:batch_size])
+        if not rows:
+            return 0
+
+        pks = [row['id'] for row in rows]
+        if model is User:
+            # roles are a relation, keep their names with the user
+            roles = {}
+            for user_id, name in User.groups.through.objects.filter(user_id__in=pks) \
+                    .values_list('user_id', 'group__name'):
+                roles.setdefault(user_id, []).append(name)
+            for row in rows:
+                row['roles'] = roles.get(row['id'], [])
+
+        label = '%s.%s' % (model._meta.app_label, model._meta.model_name)
+        ArchivedRecord.objects.bulk_create([
+            ArchivedRecord(model=label, key=row[key_field], deactivated=row['modified'],
+                           data=json.dumps(row, cls=DjangoJSONEncoder, sort_keys=True))
+            for row in rows])
+        # cascades to tokens and role memberships of users
+        model.all_objects.filter(pk__in=pks).delete()
+        return len(rows)
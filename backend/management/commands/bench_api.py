@@ -0,0 +1,144 @@
+import itertools
+import json
+import math
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from backend.models import Client, ClientType, Employee, User, UserRoles
+from .seed_bench import PASSWORD
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return 0
+    rank = max(0, min(len(values) - 1, int(math.ceil(pct / 100.0 * len(values))) - 1))
+    return values[rank]
+
+
+class Command(BaseCommand):
+    help = 'Drive the API in-process and report latency percentiles, queries per request and rows/sec'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario (default: 200)')
+        parser.add_argument('--page-size', type=int, default=100, help='List page size (default: 100)')
+        parser.add_argument('--only', nargs='+', metavar='SCENARIO', help='Run only these scenarios')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--compare', metavar='FILE', help='Print the change against an earlier --output file')
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(email__startswith='bench-user-', is_active=True).order_by('pk').first()
+        employee = Employee.objects.filter(email__startswith='bench-employee-').order_by('pk').first()
+        client = Client.objects.filter(id__startswith='bench-').order_by('pk').first()
+        if not (user and employee and client):
+            raise CommandError('No benchmark data found, run `manage.py seed_bench` first')
+
+        page = '?page_size=%d' % options['page_size']
+        counter = itertools.count()
+        scenarios = [
+            # name, method, path, body factory
+            ('users-list', 'get', '/api/v1/users' + page, None),
+            ('users-detail', 'get', '/api/v1/users/' + user.email, None),
+            ('users-search', 'get', '/api/v1/users%s&search=%s' % (page, user.last_name), None),
+            ('users-create', 'post', '/api/v1/users', lambda: {
+                'email': 'bench-new-%d@pegula.io' % next(counter), 'password': PASSWORD, 'first_name': 'New',
+                'last_name': 'User', 'roles': [UserRoles.EMPL]}),
+            ('employees-list', 'get', '/api/v1/employees' + page, None),
+            ('employees-detail', 'get', '/api/v1/employees/' + employee.email, None),
+            ('employees-search', 'get', '/api/v1/employees%s&search=%s' % (page, employee.last_name), None),
+            ('employees-create', 'post', '/api/v1/employees', lambda: {
+                'email': 'bench-new-%d@pegula.io' % next(counter), 'first_name': 'New', 'last_name': 'Hire',
+                'status': 'Candidate'}),
+            ('clients-list', 'get', '/api/v1/clients' + page, None),
+            ('clients-detail', 'get', '/api/v1/clients/' + client.id, None),
+            ('clients-create', 'post', '/api/v1/clients', lambda: {
+                'id': 'bench-new-%d' % next(counter), 'name': 'New Client', 'address': '1 Bench Street',
+                'phone': '555-0000', 'type': ClientType.TYP1}),
+            ('login', 'post', '/api/rest-auth/login/', lambda: {'email': user.email, 'password': PASSWORD}),
+        ]
+        if options['only']:
+            scenarios = [s for s in scenarios if s[0] in options['only']]
+
+        token, created = Token.objects.get_or_create(user=user)
+        api = APIClient(HTTP_HOST='localhost')
+        api.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+        results = {}
+        # writes made by the benchmark are rolled back at the end
+        with transaction.atomic():
+            for name, method, path, body in scenarios:
+                results[name] = self.run(api, method, path, body, options['requests'])
+                self.report(name, results[name])
+            transaction.set_rollback(True)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'created': timezone.now().isoformat(), 'database': connection.vendor,
+                           'requests': options['requests'], 'results': results}, f, indent=2, sort_keys=True)
+            self.stdout.write('Results written to %s' % options['output'])
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def run(self, api, method, path, body, count):
+        timings, queries, rows = [], 0, 0
+        for i in range(count):
+            data = body() if body else None
+            with CaptureQueriesContext(connection) as captured:
+                started = time.time()
+                response = getattr(api, method)(path, data, format='json') if data else getattr(api, method)(path)
+                content = response.content
+                timings.append(time.time() - started)
+            if response.status_code >= 400:
+                raise CommandError('%s %s -> %d: %s' % (method.upper(), path, response.status_code, content[:500]))
+            queries += len(captured)
+            rows += self.count_rows(content)
+
+        timings.sort()
+        total = sum(timings)
+        return {
+            'p50_ms': percentile(timings, 50) * 1000,
+            'p95_ms': percentile(timings, 95) * 1000,
+            'p99_ms': percentile(timings, 99) * 1000,
+            'mean_ms': total / count * 1000,
+            'queries_per_request': queries / float(count),
+            'rows_per_sec': rows / total if total else 0,
+        }
+
+    @staticmethod
+    def count_rows(content):
+        try:
+            data = json.loads(content.decode('utf-8'))
+        except ValueError:
+            return 0
+        if isinstance(data, dict) and 'results' in data:
+            data = data['results']
+        return len(data) if isinstance(data, list) else 1
+
+    def report(self, name, result):
+        self.stdout.write('%-18s p50 %8.2fms  p95 %8.2fms  p99 %8.2fms  %5.1f queries  %10.0f rows/sec' % (
+            name, result['p50_ms'], result['p95_ms'], result['p99_ms'], result['queries_per_request'],
+            result['rows_per_sec']))
+
+    def compare(self, path, results):
+        with open(path) as f:
+            baseline = json.load(f)['results']
+        self.stdout.write('Change against %s (p50 / p99 / queries):' % path)
+        for name, result in sorted(results.items()):
+            if name not in baseline:
+                continue
+            before = baseline[name]
+            self.stdout.write('%-18s %+7.1f%% %+7.1f%% %+6.1f' % (
+                name, self._change(before['p50_ms'], result['p50_ms']),
+                self._change(before['p99_ms'], result['p99_ms']),
+                result['queries_per_request'] - before['queries_per_request']))
+
+    @staticmethod
+    def _change(before, after):
+        return (after - before) / before * 100 if before else 0
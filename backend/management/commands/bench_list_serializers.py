@@ -0,0 +1,86 @@
+import time
+
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from rest_framework.renderers import JSONRenderer
+
+from backend.fastlist import compile_plan
+from backend.models import Employee, User, UserRoles
+from backend.serializers import EmployeeFullSerializer, UserFullSerializer, prefetch_roles
+
+
+# rows are told apart from `seed_bench`'s (`bench-user-...`, `bench-employee-...`) by this email prefix
+PREFIX = 'benchlist-'
+
+
+class Command(BaseCommand):
+    help = 'Compare list serialization through DRF serializers against the `backend.fastlist` values() path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('sizes', nargs='*', type=int, default=[1000, 10000, 100000],
+                            help='Row counts to benchmark (default: 1000 10000 100000)')
+        parser.add_argument('--repeat', type=int, default=3, help='Best of N timings (default: 3)')
+
+    def handle(self, *args, **options):
+        self.repeat = options['repeat']
+        self.stdout.write('%-10s %8s %12s %12s %8s' % ('model', 'rows', 'serializer', 'fastlist', 'speedup'))
+
+        # Everything happens in a transaction which is rolled back, so the database is left untouched
+        with transaction.atomic():
+            for size in sorted(options['sizes']):
+                self.seed(size)
+                employees = Employee.all_objects.filter(email__startswith=PREFIX).order_by('pk')
+                self.compare('employee', employees, EmployeeFullSerializer)
+                users = User.all_objects.filter(email__startswith=PREFIX).order_by('pk').prefetch_related(
+                    prefetch_roles())
+                self.compare('user', users, UserFullSerializer)
+            transaction.set_rollback(True)
+
+    def seed(self, size):
+        have = Employee.all_objects.filter(email__startswith=PREFIX).count()
+        Employee.objects.bulk_create([
+            Employee(email='%s%d@pegula.io' % (PREFIX, i), first_name='First%d' % i, last_name='Last%d' % i,
+                     role='Developer', status='Full Time', phone='555-%04d' % (i % 10000))
+            for i in range(have, size)], batch_size=500)
+        User.objects.bulk_create([
+            User(email='%s%d@pegula.io' % (PREFIX, i), first_name='First%d' % i, last_name='Last%d' % i, password='!')
+            for i in range(have, size)], batch_size=500)
+
+        # every user is an employee, every third one a manager too, so some users have several roles
+        employee, manager = Group.objects.get(name=UserRoles.EMPL), Group.objects.get(name=UserRoles.MNG)
+        new_users = list(User.all_objects.filter(email__startswith=PREFIX).exclude(groups=employee)
+                         .order_by('pk').values_list('pk', flat=True))
+        User.groups.through.objects.bulk_create(
+            [User.groups.through(user_id=pk, group_id=manager.pk) for pk in new_users[::3]] +
+            [User.groups.through(user_id=pk, group_id=employee.pk) for pk in new_users], batch_size=500)
+
+    def compare(self, label, queryset, serializer_class):
+        renderer = JSONRenderer()
+
+        def drf():
+            return renderer.render(serializer_class(list(queryset.all()), many=True).data)
+
+        plan = compile_plan(serializer_class(many=True).child)
+        if plan is None:
+            raise CommandError('%s can not be compiled to a fastlist plan' % serializer_class.__name__)
+
+        def fast():
+            return renderer.render(plan.serialize(queryset.prefetch_related(None).values(*plan.fetch)))
+
+        slow_time, slow_bytes = self.best(drf)
+        fast_time, fast_bytes = self.best(fast)
+        if slow_bytes != fast_bytes:
+            raise CommandError('%s output differs between serializer and fastlist' % label)
+
+        self.stdout.write('%-10s %8d %11.3fs %11.3fs %7.1fx' % (
+            label, queryset.count(), slow_time, fast_time, slow_time / fast_time if fast_time else 0))
+
+    def best(self, func):
+        timings = []
+        for i in range(self.repeat):
+            started = time.time()
+            result = func()
+            timings.append(time.time() - started)
+        return min(timings), result
@@ -0,0 +1,87 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from rest_framework.test import APIRequestFactory
+
+from backend.models import User
+from backend.views import ClientView, EmployeeView, UserView
+
+
+# list endpoint queries: name, view, query parameters
+LIST_QUERIES = [
+    ('users-list', UserView, {'page_size': 100}),
+    ('users-list-active', UserView, {'page_size': 100, 'status': 'active'}),
+    ('employees-list', EmployeeView, {'page_size': 100}),
+    ('employees-list-full-time', EmployeeView, {'page_size': 100, 'status': 'Full Time'}),
+    ('clients-list', ClientView, {'page_size': 100}),
+]
+
+# sequential scans, and on SQLite, sorts the index couldn't save us from
+SEQ_SCAN = {
+    'postgresql': re.compile(r'Seq Scan on \S+'),
+    'sqlite': re.compile(r'^SCAN (TABLE )?\S+( AS \S+)?$|USE TEMP B-TREE FOR ORDER BY'),
+}
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the queries behind the list endpoints and fail if any of them scans a whole table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every plan, not just failures')
+
+    def handle(self, *args, **options):
+        if connection.vendor not in SEQ_SCAN:
+            raise CommandError('Unsupported database vendor: %s' % connection.vendor)
+
+        failures = []
+        with transaction.atomic():
+            self.prepare()
+            for name, queryset in self.queries():
+                plan = self.explain(queryset)
+                scans = self.full_scans(plan)
+                if scans:
+                    failures.append(name)
+                self.stdout.write('%-26s %s' % (name, 'FULL SCAN: ' + '; '.join(scans) if scans else 'ok'))
+                if scans or options['verbose_plans']:
+                    self.stdout.write('\n'.join('    ' + line for line in plan))
+
+        if failures:
+            raise CommandError('No usable index for: %s' % ', '.join(failures))
+
+    @staticmethod
+    def prepare():
+        """Must run in the transaction EXPLAINing the queries"""
+        if connection.vendor == 'postgresql':
+            # tables of a test database are small enough that a sequential scan is cheaper, and the planner
+            # would pick it; make it use any index that fits, so that a sequential scan means there is none
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def queries(self):
+        """`(name, queryset)` of every query to check"""
+        queries = [(name, self.list_queryset(view_class, params)) for name, view_class, params in LIST_QUERIES]
+        queries.append(('platform-admins', User.platform_admins.all()))
+        return queries
+
+    @staticmethod
+    def full_scans(plan):
+        return [line for line in plan if SEQ_SCAN[connection.vendor].search(line)]
+
+    @staticmethod
+    def list_queryset(view_class, params):
+        """The query a `list` request with `params` runs, as paginated by `backend.pagination.KeysetPagination`"""
+        view = view_class(action_map={'get': 'list'}, args=(), kwargs={}, format_kwarg=None)
+        view.request = view.initialize_request(APIRequestFactory().get('/', params))
+        queryset = view.filter_queryset(view.get_queryset()).prefetch_related(None)
+        return queryset.order_by(*view.keyset_ordering)[:int(params['page_size']) + 1]
+
+    @staticmethod
+    def explain(queryset):
+        sql, params = queryset.query.sql_with_params()
+        prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            # SQLite rows are (id, parent, notused, detail), PostgreSQL ones a single line of text
+            return [row[-1] for row in cursor.fetchall()]
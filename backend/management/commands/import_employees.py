@@ -0,0 +1,197 @@
+import csv
+import io
+import json
+import os
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from backend.models import Employee
+from backend.stats import rebuild as rebuild_stats
+
+
+# Columns accepted from import files; anything missing from a row gets the model default
+IMPORT_FIELDS = ('email', 'first_name', 'last_name', 'role', 'is_active', 'date_from', 'date_to', 'phone', 'status')
+
+STAGING_TABLE = 'backend_employee_import'
+
+# Spellings of booleans found in HR system exports, which `BooleanField.to_python` doesn't accept
+BOOLEAN_VALUES = {'true': True, 't': True, 'yes': True, 'y': True, '1': True,
+                  'false': False, 'f': False, 'no': False, 'n': False, '0': False}
+
+
+class Command(BaseCommand):
+    help = 'Bulk load Employees from CSV or NDJSON files, creating or updating them by `email`'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', metavar='FILE',
+                            help='CSV (with a header row) or NDJSON files; format is taken from the extension')
+        parser.add_argument('--format', choices=('csv', 'ndjson'),
+                            help='Override the file format instead of guessing from the extension')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows written per COPY / executemany batch (default: 5000)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only validate the files and report errors, write nothing')
+        parser.add_argument('--progress', type=int, default=100000, metavar='N',
+                            help='Report progress every N rows (default: 100000, 0 to disable)')
+
+    def handle(self, *args, **options):
+        self.fields = [Employee._meta.get_field(name) for name in IMPORT_FIELDS]
+        self.batch_size = options['batch_size']
+        self.progress = options['progress']
+        self.dry_run = options['dry_run']
+        self.seen = set()
+        self.stats = {'read': 0, 'valid': 0, 'invalid': 0}
+        self.started = time.time()
+
+        if self.dry_run:
+            for batch in self.batches(options['paths'], options['format']):
+                pass
+        elif connection.vendor == 'postgresql':
+            self.load_postgresql(options['paths'], options['format'])
+        elif connection.vendor == 'sqlite':
+            self.load_sqlite(options['paths'], options['format'])
+        else:
+            raise CommandError('Unsupported database vendor: %s' % connection.vendor)
+        if not self.dry_run:
+            rebuild_stats()  # the raw SQL writes bypass the signals maintaining the dashboard counters
+
+        elapsed = time.time() - self.started
+        self.stdout.write('%s%d rows read, %d valid, %d invalid in %.1fs (%d rows/sec)' % (
+            'DRY RUN: ' if self.dry_run else '', self.stats['read'], self.stats['valid'], self.stats['invalid'],
+            elapsed, self.stats['read'] / elapsed if elapsed else 0))
+        if 'created' in self.stats:
+            self.stdout.write('%d employees created, %d updated' % (self.stats['created'], self.stats['updated']))
+
+    #
+    # Loaders
+    #
+
+    @transaction.atomic
+    def load_postgresql(self, paths, fmt):
+        """COPY every batch into a temp staging table, then merge it into `backend_employee` on `email`"""
+        table = Employee._meta.db_table
+        columns = ', '.join(f.column for f in self.fields)
+        not_null = ', '.join(f.column for f in self.fields if not f.null)
+        assignments = ', '.join('%s = s.%s' % (f.column, f.column) for f in self.fields if f.name != 'email')
+
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TEMP TABLE %s ON COMMIT DROP AS SELECT %s FROM %s WITH NO DATA'
+                           % (STAGING_TABLE, columns, table))
+            copy = 'COPY %s (%s) FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL (%s))' % (STAGING_TABLE, columns, not_null)
+
+            for batch in self.batches(paths, fmt):
+                buf = io.StringIO()
+                csv.writer(buf).writerows(batch)
+                buf.seek(0)
+                cursor.copy_expert(copy, buf)
+
+            cursor.execute('CREATE UNIQUE INDEX ON %s (email)' % STAGING_TABLE)
+            cursor.execute('ANALYZE %s' % STAGING_TABLE)
+            cursor.execute('UPDATE %s e SET %s, modified = now() FROM %s s WHERE e.email = s.email'
+                           % (table, assignments, STAGING_TABLE))
+            self.stats['updated'] = cursor.rowcount
+            cursor.execute('INSERT INTO %s (%s, created, modified) SELECT %s, now(), now() FROM %s s '
+                           'WHERE NOT EXISTS (SELECT 1 FROM %s e WHERE e.email = s.email)'
+                           % (table, columns, columns, STAGING_TABLE, table))
+            self.stats['created'] = cursor.rowcount
+
+    @transaction.atomic
+    def load_sqlite(self, paths, fmt):
+        """UPDATE existing emails, then INSERT OR IGNORE the rest, one `executemany` of each per batch"""
+        table = Employee._meta.db_table
+        columns = [f.column for f in self.fields]
+        update = 'UPDATE %s SET %s, modified = ? WHERE email = ?' % (
+            table, ', '.join('%s = ?' % c for c in columns if c != 'email'))
+        insert = 'INSERT OR IGNORE INTO %s (%s, created, modified) VALUES (%s)' % (
+            table, ', '.join(columns), ', '.join('?' * (len(columns) + 2)))
+        email = IMPORT_FIELDS.index('email')
+        self.stats['created'] = self.stats['updated'] = 0
+
+        with connection.cursor() as cursor:
+            for batch in self.batches(paths, fmt):
+                now = Employee._meta.get_field('modified').get_db_prep_save(timezone.now(), connection)
+                cursor.executemany(update, [row[:email] + row[email + 1:] + (now, row[email]) for row in batch])
+                self.stats['updated'] += cursor.rowcount
+                cursor.executemany(insert, [row + (now, now) for row in batch])
+                self.stats['created'] += cursor.rowcount
+
+    #
+    # Reading & validation
+    #
+
+    def batches(self, paths, fmt):
+        """Yield lists of validated rows, as tuples of DB-ready values in `IMPORT_FIELDS` order"""
+        batch = []
+        for path in paths:
+            for lineno, raw in self.read(path, fmt or os.path.splitext(path)[1].lstrip('.').lower()):
+                self.stats['read'] += 1
+                row = self.clean(path, lineno, raw)
+                if row is not None:
+                    self.stats['valid'] += 1
+                    if not self.dry_run:
+                        batch.append(row)
+                if len(batch) >= self.batch_size:
+                    yield batch
+                    batch = []
+                if self.progress and self.stats['read'] % self.progress == 0:
+                    elapsed = time.time() - self.started
+                    self.stdout.write('  %d rows (%d rows/sec)' % (self.stats['read'], self.stats['read'] / elapsed))
+        if batch:
+            yield batch
+
+    def read(self, path, fmt):
+        if fmt not in ('csv', 'ndjson'):
+            raise CommandError('%s: unknown format %r, use --format' % (path, fmt))
+        with open(path, newline='', encoding='utf-8') as f:
+            if fmt == 'csv':
+                # line 1 is the header
+                for lineno, raw in enumerate(csv.DictReader(f), 2):
+                    yield lineno, raw
+            else:
+                for lineno, line in enumerate(f, 1):
+                    if line.strip():
+                        try:
+                            yield lineno, json.loads(line)
+                        except ValueError as e:
+                            yield lineno, e
+
+    def clean(self, path, lineno, raw):
+        if isinstance(raw, Exception) or not isinstance(raw, dict):
+            return self.invalid(path, lineno, {'__all__': ['Not a JSON object: %s' % raw]})
+
+        row, errors = [], {}
+        for field in self.fields:
+            value = raw.get(field.name)
+            if value in (None, '') and field.has_default():
+                value = field.get_default()
+            elif value is None and not field.null:
+                value = ''
+            elif field.get_internal_type() == 'BooleanField' and isinstance(value, str):
+                value = BOOLEAN_VALUES.get(value.strip().lower(), value)
+            try:
+                value = field.clean(value, None)
+            except ValidationError as e:
+                errors[field.name] = e.messages
+                continue
+            if field.get_internal_type() == 'DateTimeField' and value and timezone.is_naive(value):
+                value = timezone.make_aware(value, timezone.get_default_timezone())
+            row.append(field.get_db_prep_save(value, connection))
+
+        if not errors:
+            email = row[IMPORT_FIELDS.index('email')]
+            if email in self.seen:
+                errors['email'] = ['Duplicate email in import']
+            self.seen.add(email)
+        if errors:
+            return self.invalid(path, lineno, errors)
+        return tuple(row)
+
+    def invalid(self, path, lineno, errors):
+        self.stats['invalid'] += 1
+        self.stderr.write('%s:%d: %s' % (path, lineno, '; '.join(
+            '%s: %s' % (name, ' '.join(messages)) for name, messages in sorted(errors.items()))))
+        return None
@@ -0,0 +1,56 @@
+import glob
+import os
+import pstats
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from backend.profiling import make_profile_token
+
+
+class Command(BaseCommand):
+    help = 'Merge the per-process `.pstats` files in PROFILE_DIR and print the top cumulative hotspots'
+
+    def add_arguments(self, parser):
+        parser.add_argument('endpoints', nargs='*', metavar='ENDPOINT',
+                            help='URL names to report on, e.g. users-list (default: all)')
+        parser.add_argument('--limit', type=int, default=25, help='Functions to print per endpoint (default: 25)')
+        parser.add_argument('--sort', default='cumulative', help='pstats sort key (default: cumulative)')
+        parser.add_argument('--dir', default=getattr(settings, 'PROFILE_DIR', None),
+                            help='Directory holding the .pstats files (default: PROFILE_DIR)')
+        parser.add_argument('--clear', action='store_true', help='Delete the .pstats files after reporting')
+        parser.add_argument('--token', action='store_true',
+                            help='Just print a signed value for the X-Profile request header')
+
+    def handle(self, *args, **options):
+        if options['token']:
+            self.stdout.write(make_profile_token())
+            return
+
+        directory = options['dir']
+        if not directory or not os.path.isdir(directory):
+            raise CommandError('No profile directory %r' % directory)
+
+        files = {}
+        for path in sorted(glob.glob(os.path.join(directory, '*.pstats'))):
+            endpoint = os.path.basename(path).rsplit('.', 2)[0]  # <endpoint>.<pid>.pstats
+            if not options['endpoints'] or endpoint in options['endpoints']:
+                files.setdefault(endpoint, []).append(path)
+        if not files:
+            raise CommandError('No profiles found in %s' % directory)
+
+        for endpoint, paths in sorted(files.items()):
+            stats = pstats.Stats(*paths, stream=self.stdout)
+            self.stdout.write('=' * 100)
+            self.stdout.write('%s: %d calls profiled from %d process(es)' % (
+                endpoint, self.count_requests(stats), len(paths)))
+            stats.strip_dirs().sort_stats(options['sort']).print_stats(options['limit'])
+            if options['clear']:
+                for path in paths:
+                    os.remove(path)
+
+    @staticmethod
+    def count_requests(stats):
+        # every profiled request enters `ProfilingMixin.dispatch.<locals>.run` exactly once
+        return sum(primitive for (filename, line, name), (primitive, total, tt, ct, callers)
+                   in stats.stats.items() if name == 'run' and filename.endswith('profiling.py'))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from backend import stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the dashboard counters behind `/api/v1/stats` from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only compare the counters with a full aggregate, and fail if they differ')
+
+    def handle(self, *args, **options):
+        started = time.time()
+        if options['check']:
+            mismatches = stats.check()
+            for dimension, value, counter, actual in mismatches:
+                self.stdout.write('%s %r: counter %d, actual %d' % (dimension, value, counter, actual))
+            if mismatches:
+                raise CommandError('%d counters are off, run `manage.py rebuild_stats`' % len(mismatches))
+            self.stdout.write('Counters are consistent (checked in %.1fs)' % (time.time() - started))
+        else:
+            count = stats.rebuild()
+            self.stdout.write('%d counters rebuilt in %.1fs' % (count, time.time() - started))
@@ -0,0 +1,98 @@
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from backend import stats
+from backend.cache import bump_cache_version
+from backend.models import Client, ClientType, Employee, User, UserRoles
+
+
+# Every generated record is recognisable by these prefixes, so it can be cleared again
+USER_EMAIL = 'bench-user-%d@pegula.io'
+EMPLOYEE_EMAIL = 'bench-employee-%d@pegula.io'
+CLIENT_ID = 'bench-%d'
+
+# All generated users share this password (hashed once), see `bench_api`
+PASSWORD = 'bench'
+
+FIRST_NAMES = ('Ana', 'Ivan', 'Marko', 'Petra', 'Luka', 'Ivana', 'Josip', 'Maja', 'Tomislav', 'Sara')
+LAST_NAMES = ('Horvat', 'Kovacic', 'Babic', 'Maric', 'Juric', 'Novak', 'Knezevic', 'Vukovic', 'Markovic')
+EMPLOYEE_STATUSES = ('Full Time', 'Contract', 'Candidate')
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic users (with roles), employees and clients for benchmarking, using bulk inserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help='Number of users (default: 1000)')
+        parser.add_argument('--employees', type=int, default=10000, help='Number of employees (default: 10000)')
+        parser.add_argument('--clients', type=int, default=100, help='Number of clients (default: 100)')
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows per INSERT (default: 500)')
+        parser.add_argument('--clear', action='store_true', help='Delete previously generated records first')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        if options['clear']:
+            self.clear()
+
+        for label, count, seed in (('users', options['users'], self.seed_users),
+                                   ('employees', options['employees'], self.seed_employees),
+                                   ('clients', options['clients'], self.seed_clients)):
+            started = time.time()
+            created = seed(count)
+            elapsed = time.time() - started
+            self.stdout.write('%d %s created in %.1fs (%d rows/sec)' % (
+                created, label, elapsed, created / elapsed if elapsed else 0))
+
+        # bulk inserts skip the model signals which normally invalidate cached responses and count employees
+        bump_cache_version('client')
+        stats.rebuild()
+
+    def clear(self):
+        User.all_objects.filter(email__startswith='bench-user-').delete()
+        Employee.all_objects.filter(email__startswith='bench-employee-').delete()
+        Client.objects.filter(id__startswith='bench-').delete()
+
+    def seed_users(self, count):
+        start = User.all_objects.filter(email__startswith='bench-user-').count()
+        last_pk = User.all_objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        password = make_password(PASSWORD)
+        User.objects.bulk_create([
+            User(email=USER_EMAIL % i, password=password, phone=self.phone(i),
+                 first_name=FIRST_NAMES[i % len(FIRST_NAMES)], last_name=LAST_NAMES[i % len(LAST_NAMES)],
+                 status='active' if i % 10 else 'deactivated', is_active=bool(i % 10))
+            for i in range(start, start + count)], batch_size=self.batch_size)
+
+        # cycle the roles over the new users
+        roles = list(Group.objects.filter(name__in=UserRoles.valid_types).order_by('name'))
+        users = User.all_objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True).iterator()
+        User.groups.through.objects.bulk_create([
+            User.groups.through(user_id=pk, group_id=roles[n % len(roles)].pk) for n, pk in enumerate(users)
+        ], batch_size=self.batch_size)
+        return count
+
+    def seed_employees(self, count):
+        start = Employee.all_objects.filter(email__startswith='bench-employee-').count()
+        Employee.objects.bulk_create([
+            Employee(email=EMPLOYEE_EMAIL % i, phone=self.phone(i), role='Role %d' % (i % 20),
+                     first_name=FIRST_NAMES[i % len(FIRST_NAMES)], last_name=LAST_NAMES[i % len(LAST_NAMES)],
+                     status=EMPLOYEE_STATUSES[i % len(EMPLOYEE_STATUSES)])
+            for i in range(start, start + count)], batch_size=self.batch_size)
+        return count
+
+    def seed_clients(self, count):
+        start = Client.objects.filter(id__startswith='bench-').count()
+        types = sorted(ClientType.valid_types)
+        Client.objects.bulk_create([
+            Client(id=CLIENT_ID % i, name='Bench Client %d' % i, address='Ilica %d, Zagreb' % i,
+                   phone=self.phone(i), type=types[i % len(types)])
+            for i in range(start, start + count)], batch_size=self.batch_size)
+        return count
+
+    @staticmethod
+    def phone(i):
+        return '+385 1 %07d' % i
@@ -0,0 +1,36 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from backend.mail import deliver_batch
+
+
+class Command(BaseCommand):
+    help = 'Deliver the emails queued by `backend.mail.OutboxEmailBackend`, in batches over one connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Messages per connection (default: 100)')
+        parser.add_argument('--max-attempts', type=int, default=getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 5),
+                            help='Give up on a message after this many failed attempts (default: %(default)s)')
+        parser.add_argument('--backend', help='Deliver through this email backend instead of '
+                                              '`OUTBOX_DELIVERY_BACKEND`, e.g. the console one')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new messages instead of '
+                                                                'exiting once the outbox is drained')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds between polls with --loop '
+                                                                      '(default: 5)')
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = deliver_batch(options['batch_size'], options['max_attempts'], options['backend'])
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                self.stdout.write('%d sent, %d failed' % (sent, failed))
+            if sent and not failed:
+                continue  # there may be more waiting
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write('Outbox drained: %d sent, %d failed' % (total_sent, total_failed))
@@ -0,0 +1,76 @@
+import logging
+import time
+
+from django.conf import settings
+from django.db import connections
+
+from . import instrumentation, replicas
+
+
+__all__ = 'QueryInstrumentationMiddleware', 'ReplicaRoutingMiddleware'
+
+log = logging.getLogger(__name__)
+
+
+class QueryInstrumentationMiddleware(object):
+    """Records SQL count and time, serializer time and view time of every request
+
+    The numbers are sent back in a `Server-Timing` header and logged as one `key=value` line on the
+    `backend` logger. Any statement repeated `INSTRUMENTATION_DUPLICATE_QUERY_THRESHOLD` times or more in
+    one request is logged as a warning, which is how N+1 regressions show up. Put it first in
+    `MIDDLEWARE_CLASSES` so `total` covers the other middleware too.
+    """
+
+    def __init__(self):
+        self.duplicate_threshold = getattr(settings, 'INSTRUMENTATION_DUPLICATE_QUERY_THRESHOLD', 5)
+
+    def process_request(self, request):
+        for connection in connections.all():
+            instrumentation.instrument_connection(connection)
+        instrumentation.start_request()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = instrumentation.current_stats()
+        if stats is not None:
+            stats.view_started = time.time()
+
+    def process_response(self, request, response):
+        stats = instrumentation.finish_request()
+        if stats is None:
+            return response  # an earlier middleware short-circuited before `process_request`
+
+        now = time.time()
+        timings = [
+            ('db', stats.db_time, '%d queries' % stats.queries),
+            ('serializer', stats.timers['serializer'], None),
+            ('view', now - getattr(stats, 'view_started', now), None),
+            ('total', now - stats.started, None),
+        ]
+        response['Server-Timing'] = ', '.join(
+            '%s;dur=%.1f%s' % (name, seconds * 1000, ';desc="%s"' % desc if desc else '')
+            for name, seconds, desc in timings)
+
+        log.info('method=%s path=%s status=%d queries=%d db_opens=%d %s', request.method, request.path,
+                 response.status_code, stats.queries, getattr(stats, 'connections_opened', 0),
+                 ' '.join('%s_ms=%.1f' % (name, seconds * 1000) for name, seconds, desc in timings))
+        for sql, count in stats.duplicates(self.duplicate_threshold):
+            log.warning('duplicate query x%d on %s %s: %s', count, request.method, request.path, sql[:500])
+        return response
+
+
+class ReplicaRoutingMiddleware(object):
+    """Lets `backend.replicas.ReplicaRouter` send the reads of GET and HEAD requests to a read replica
+
+    Clients which wrote recently keep reading from `default` (see `backend.replicas`). Put it right after
+    `QueryInstrumentationMiddleware`, before anything that might query the database.
+    """
+
+    def process_request(self, request):
+        use_replica = (request.method in replicas.SAFE_METHODS and bool(replicas.get_replicas()) and
+                       not replicas.is_sticky(request))
+        replicas.start_request(use_replica)
+
+    def process_response(self, request, response):
+        if replicas.finish_request():
+            replicas.mark_sticky(request, response)
+        return response
@@ -0,0 +1,86 @@
+from django.db import migrations
+
+
+#
+# Substring search indexes backing `backend.filters.IndexedSearchFilter`
+#
+# PostgreSQL gets `pg_trgm` GIN indexes, SQLite gets an FTS5 trigram "external content" table kept
+# in sync with triggers. NOTE: SQLite drops triggers when Django rebuilds a table (e.g. AlterField),
+# so any later migration that remakes `backend_user`/`backend_employee` must re-run `create_fts()`.
+#
+
+SEARCHABLE = [
+    # table, columns
+    ('backend_user', ('email', 'first_name', 'last_name')),
+    ('backend_employee', ('email', 'first_name', 'last_name')),
+]
+
+# FTS5's trigram tokenizer first shipped with SQLite 3.34
+SQLITE_TRIGRAM_VERSION = (3, 34, 0)
+
+
+def fts_table_name(table):
+    # inlined rather than imported from `backend.filters`, which would load the app's models; keep in sync
+    return '%s_fts' % table
+
+
+def _sqlite_fts(table, columns):
+    fts = fts_table_name(table)
+    cols = ', '.join(columns)
+    new = ', '.join('new.%s' % c for c in columns)
+    old = ', '.join('old.%s' % c for c in columns)
+    insert = "INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new});"
+    delete = "INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old});"
+    return [sql.format(fts=fts, table=table, cols=cols, new=new, old=old) for sql in (
+        "CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{table}', content_rowid='id', tokenize='trigram')",
+        "CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN " + insert + " END",
+        "CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN " + delete + " END",
+        "CREATE TRIGGER {fts}_au AFTER UPDATE ON {table} BEGIN " + delete + ' ' + insert + " END",
+        "INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    )]
+
+
+def _sqlite_has_fts5_trigram(schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5'), sqlite_version()")
+        has_fts5, version = cursor.fetchone()
+    return bool(has_fts5) and tuple(int(part) for part in version.split('.')[:3]) >= SQLITE_TRIGRAM_VERSION
+
+
+def create_fts(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table, columns in SEARCHABLE:
+            for column in columns:
+                schema_editor.execute('CREATE INDEX {0}_{1}_trgm ON {0} USING gin ({1} gin_trgm_ops)'
+                                      .format(table, column))
+    elif vendor == 'sqlite' and _sqlite_has_fts5_trigram(schema_editor):
+        for table, columns in SEARCHABLE:
+            for sql in _sqlite_fts(table, columns):
+                schema_editor.execute(sql)
+
+
+def drop_fts(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for table, columns in SEARCHABLE:
+            for column in columns:
+                schema_editor.execute('DROP INDEX IF EXISTS {0}_{1}_trgm'.format(table, column))
+    elif vendor == 'sqlite':
+        for table, columns in SEARCHABLE:
+            fts = fts_table_name(table)
+            for suffix in ('ai', 'ad', 'au'):
+                schema_editor.execute('DROP TRIGGER IF EXISTS {0}_{1}'.format(fts, suffix))
+            schema_editor.execute('DROP TABLE IF EXISTS {0}'.format(fts))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0003_custom_demo_data'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
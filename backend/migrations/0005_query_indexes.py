@@ -0,0 +1,61 @@
+from django.db import migrations
+
+
+#
+# Composite and partial indexes matching the API's list queries (check them with `manage.py check_query_plans`)
+#
+# Users and employees are listed filtered by `status` and keyset-paginated by `email` (see `backend.views`),
+# clients by their primary key; `(modified, id)` serves clients sorted by recency. Partial indexes on active
+# rows are PostgreSQL only: SQLite only uses a partial index when the query's WHERE clause spells out the same
+# literal, never for bound parameters.
+#
+# Created with raw SQL rather than `Meta.index_together` so that SQLite never rebuilds these tables, which
+# would drop the FTS triggers of `0004_search_indexes`. The single column `status` indexes are left in place
+# for the same reason, even though the composites make them redundant.
+#
+
+INDEXES = [
+    # name, table, columns
+    ('backend_user_status_email', 'backend_user', ('status', 'email')),
+    ('backend_user_status_name', 'backend_user', ('status', 'last_name', 'first_name')),
+    ('backend_user_status_modified', 'backend_user', ('status', 'modified')),
+    ('backend_employee_status_email', 'backend_employee', ('status', 'email')),
+    ('backend_employee_status_name', 'backend_employee', ('status', 'last_name', 'first_name')),
+    ('backend_employee_status_modified', 'backend_employee', ('status', 'modified')),
+    ('backend_client_modified_id', 'backend_client', ('modified', 'id')),
+]
+
+PARTIAL_INDEXES = [
+    # name, table, columns, predicate
+    ('backend_user_active_email', 'backend_user', ('email',), "status = 'active'"),
+    ('backend_user_active_name', 'backend_user', ('last_name', 'first_name'), "status = 'active'"),
+    ('backend_employee_active_email', 'backend_employee', ('email',), 'is_active'),
+    ('backend_employee_active_name', 'backend_employee', ('last_name', 'first_name'), 'is_active'),
+]
+
+
+def create_indexes(apps, schema_editor):
+    qn = schema_editor.quote_name
+    for name, table, columns in INDEXES:
+        schema_editor.execute('CREATE INDEX {0} ON {1} ({2})'.format(
+            qn(name), qn(table), ', '.join(qn(c) for c in columns)))
+    if schema_editor.connection.vendor == 'postgresql':
+        for name, table, columns, predicate in PARTIAL_INDEXES:
+            schema_editor.execute('CREATE INDEX {0} ON {1} ({2}) WHERE {3}'.format(
+                qn(name), qn(table), ', '.join(qn(c) for c in columns), predicate))
+
+
+def drop_indexes(apps, schema_editor):
+    for index in INDEXES + PARTIAL_INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS {0}'.format(schema_editor.quote_name(index[0])))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0004_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,61 @@
+from django.db import models, migrations
+import backend.models
+
+
+#
+# `objects` now leaves out deactivated rows, and `manage.py archive_inactive` moves long-deactivated ones
+# to `ArchivedRecord`. On PostgreSQL, the archival batches get partial indexes of their own; the active rows
+# already have theirs from `0005_query_indexes`.
+#
+
+INACTIVE_INDEXES = [
+    # name, table, predicate
+    ('backend_user_inactive_modified', 'backend_user', "status <> 'active'"),
+    ('backend_employee_inactive_modified', 'backend_employee', 'NOT is_active'),
+]
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        qn = schema_editor.quote_name
+        for name, table, predicate in INACTIVE_INDEXES:
+            schema_editor.execute('CREATE INDEX {0} ON {1} (modified, id) WHERE {2}'.format(
+                qn(name), qn(table), predicate))
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for name, table, predicate in INACTIVE_INDEXES:
+            schema_editor.execute('DROP INDEX IF EXISTS {0}'.format(schema_editor.quote_name(name)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0005_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='user',
+            managers=[
+                ('all_objects', backend.models.PegulaUserManager()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedRecord',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False, verbose_name='ID', auto_created=True)),
+                ('model', models.CharField(max_length=32)),
+                ('key', models.CharField(max_length=64)),
+                ('data', models.TextField()),
+                ('deactivated', models.DateTimeField()),
+                ('archived', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='archivedrecord',
+            index_together=set([('model', 'key')]),
+        ),
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
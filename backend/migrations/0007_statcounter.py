@@ -0,0 +1,40 @@
+from django.db import models, migrations
+from django.db.models import Count
+
+
+def build_counters(apps, schema_editor):
+    # the counters are only adjusted from here on, so start them off with the current totals (as in
+    # `backend.stats.rebuild()`, which can't be used with the historical models)
+    Employee, Client, StatCounter = (apps.get_model('backend', name) for name in ('Employee', 'Client', 'StatCounter'))
+    counters = []
+    for dimension, queryset, field in (
+            ('employees_by_status', Employee._default_manager.filter(is_active=True), 'status'),
+            ('employees_by_role', Employee._default_manager.filter(is_active=True), 'role'),
+            ('clients_by_type', Client._default_manager.all(), 'type')):
+        counters.extend(StatCounter(dimension=dimension, value=value, count=count)
+                        for value, count in queryset.order_by().values_list(field).annotate(n=Count('pk')))
+    StatCounter._default_manager.bulk_create(counters)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0006_active_managers_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatCounter',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False, verbose_name='ID', auto_created=True)),
+                ('dimension', models.CharField(max_length=32)),
+                ('value', models.CharField(max_length=64, blank=True)),
+                ('count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='statcounter',
+            unique_together=set([('dimension', 'value')]),
+        ),
+        migrations.RunPython(build_counters, migrations.RunPython.noop),
+    ]
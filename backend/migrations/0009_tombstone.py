@@ -0,0 +1,49 @@
+from django.db import models, migrations
+import django.utils.timezone
+
+
+#
+# `/changes` walks each table in `(modified, id)` order (see `backend.changes`); clients have had that
+# index since `0005_query_indexes`. Raw SQL, for the reason given there.
+#
+
+INDEXES = [
+    # name, table
+    ('backend_user_modified_id', 'backend_user'),
+    ('backend_employee_modified_id', 'backend_employee'),
+]
+
+
+def create_indexes(apps, schema_editor):
+    qn = schema_editor.quote_name
+    for name, table in INDEXES:
+        schema_editor.execute('CREATE INDEX {0} ON {1} (modified, id)'.format(qn(name), qn(table)))
+
+
+def drop_indexes(apps, schema_editor):
+    for name, table in INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS {0}'.format(schema_editor.quote_name(name)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0008_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False, verbose_name='ID', auto_created=True)),
+                ('resource', models.CharField(max_length=16)),
+                ('key', models.CharField(max_length=64)),
+                ('deleted', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='tombstone',
+            index_together=set([('deleted', 'id')]),
+        ),
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
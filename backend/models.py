@@ -8,6 +8,18 @@ from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseU
 from django.utils.translation import ugettext_lazy as _
 
 
+class ActiveManagerMixin(object):
+    """Manager mixin limiting querysets to the rows matching `active_filter`, i.e. the ones not soft-deleted
+
+    Models declare an unfiltered `all_objects` manager *first*, so that Django's `_default_manager` (used by
+    the admin, authentication backends, uniqueness validation and related lookups) still sees every row.
+    """
+    active_filter = {}
+
+    def get_queryset(self):
+        return super(ActiveManagerMixin, self).get_queryset().filter(**self.active_filter)
+
+
 class TimestampedModel(models.Model):
     """Abstract base Model which provides auto-updating `created` and `modified` fields"""
     created = models.DateTimeField(auto_now_add=True)
@@ -18,7 +30,8 @@ class TimestampedModel(models.Model):
 
 
 __all__ = 'Client', 'ClientType', \
-          'User', 'UserRoles', 'Employee'
+          'User', 'UserRoles', 'Employee', 'ArchivedRecord', 'StatCounter', 'OutboxMessage', \
+          'Tombstone'
 
 log = logging.getLogger(__name__)
 
@@ -82,7 +95,14 @@ class PegulaUserManager(BaseUserManager):
 
 class PegulaAdminManager(models.Manager):
     def get_queryset(self):
-        return super(PegulaAdminManager, self).get_queryset().filter(groups__name=UserRoles.ADMIN)
+        # prefetch `groups` so `User.roles` (and so `is_platform_admin`) resolves without another query
+        return super(PegulaAdminManager, self).get_queryset().filter(groups__name=UserRoles.ADMIN) \
+            .prefetch_related('groups')
+
+
+class ActiveUserManager(ActiveManagerMixin, PegulaUserManager):
+    use_in_migrations = False
+    active_filter = {'status': 'active'}
 
 
 class User(TimestampedModel, AbstractBaseUser, PermissionsMixin):
@@ -106,8 +126,9 @@ class User(TimestampedModel, AbstractBaseUser, PermissionsMixin):
     phone = models.CharField(max_length=24, blank=True)
     status = models.CharField(choices=USER_STATUS, default='active', max_length=12, db_index=True)
 
-    # Query managers
-    objects = PegulaUserManager()
+    # Query managers; `objects` leaves out deactivated users
+    all_objects = PegulaUserManager()
+    objects = ActiveUserManager()
     platform_admins = PegulaAdminManager()
 
     class Meta:
@@ -127,9 +148,26 @@ class User(TimestampedModel, AbstractBaseUser, PermissionsMixin):
         """Sends an email to this User."""
         send_mail(subject, message, from_email, [self.email], **kwargs)
 
+    # memoized by `roles`, reset by `backend.signals` when `groups` changes
+    _roles = None
+
+    @property
+    def roles(self):
+        """Immutable set of this user's role (Group) names, resolved at most once per instance"""
+        if self._roles is None:
+            prefetched = getattr(self, '_prefetched_objects_cache', {}).get('groups')
+            if prefetched is not None:
+                names = [group.name for group in prefetched]
+            elif self.pk is None:
+                names = []  # unsaved users can't have groups yet
+            else:
+                names = self.groups.values_list('name', flat=True)
+            self._roles = frozenset(names)
+        return self._roles
+
     @property
     def is_platform_admin(self):
-        return self.groups.filter(name=UserRoles.ADMIN).exists()
+        return UserRoles.ADMIN in self.roles
 
     @property
     def is_org_user(self):
@@ -154,6 +192,10 @@ class User(TimestampedModel, AbstractBaseUser, PermissionsMixin):
         return self.email
 
 
+class ActiveEmployeeManager(ActiveManagerMixin, models.Manager):
+    active_filter = {'is_active': True}
+
+
 class Employee(TimestampedModel):
     email = models.EmailField(_('email address'), max_length=48, unique=True, blank=False, db_index=True,
                               error_messages={
@@ -171,7 +213,9 @@ class Employee(TimestampedModel):
     phone = models.CharField(max_length=24, blank=True)
     status = models.CharField(choices=EMPLOYEE_STATUS, max_length=12, db_index=True)
 
-    objects = models.Manager()
+    # Query managers; `objects` leaves out deactivated employees
+    all_objects = models.Manager()
+    objects = ActiveEmployeeManager()
 
     def create_employee(self, email, is_staff, is_superuser, **extra_fields):
         now = timezone.now()
@@ -247,3 +291,74 @@ class Client(TimestampedModel):
         if not self.id:
             self.id = slugify(self.name)
         return super(Client, self).save(*args, **kwargs)
+
+
+#
+# Archive
+#
+
+class ArchivedRecord(models.Model):
+    """A long-deactivated row moved out of its table by `manage.py archive_inactive`, kept as JSON"""
+    model = models.CharField(max_length=32)  # e.g. `backend.user`
+    key = models.CharField(max_length=64)  # natural key, e.g. the email address
+    data = models.TextField()
+    deactivated = models.DateTimeField()  # the row's last `modified`, i.e. when it was deactivated
+    archived = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        index_together = [('model', 'key')]
+
+    def __str__(self):
+        return '%s %s' % (self.model, self.key)
+
+
+#
+# Statistics
+#
+
+class StatCounter(models.Model):
+    """One dashboard headcount, e.g. active employees with `status` "Contract"; maintained by `backend.stats`"""
+    dimension = models.CharField(max_length=32)
+    value = models.CharField(max_length=64, blank=True)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = [('dimension', 'value')]
+
+    def __str__(self):
+        return '%s %s: %d' % (self.dimension, self.value, self.count)
+
+
+#
+# Outbound email
+#
+
+class OutboxMessage(models.Model):
+    """An email waiting for `manage.py send_outbox`, queued by `backend.mail.OutboxEmailBackend`"""
+    created = models.DateTimeField(auto_now_add=True)
+    send_after = models.DateTimeField(default=timezone.now, db_index=True)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    recipients = models.TextField()  # for people reading the table, delivery uses `message`
+    subject = models.CharField(max_length=255, blank=True)
+    message = models.BinaryField()  # the pickled `EmailMessage`
+
+    def __str__(self):
+        return '%s to %s' % (self.subject, self.recipients)
+
+
+#
+# Delta sync
+#
+
+class Tombstone(models.Model):
+    """A deleted User, Employee or Client, reported by the `/changes` feed (see `backend.changes`)"""
+    resource = models.CharField(max_length=16)  # `users`, `employees` or `clients`
+    key = models.CharField(max_length=64)  # the resource's lookup field, e.g. the email address
+    deleted = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        index_together = [('deleted', 'id')]
+
+    def __str__(self):
+        return '%s %s' % (self.resource, self.key)
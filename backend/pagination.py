@@ -0,0 +1,201 @@
+import json
+import logging
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from datetime import datetime
+from functools import reduce
+
+from django.db.models import Q
+from django.utils.translation import ugettext_lazy as _
+
+from rest_framework.compat import OrderedDict
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response as RestResponse
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+
+__all__ = 'KeysetPagination',
+
+log = logging.getLogger(__name__)
+
+
+def _reverse_ordering(ordering):
+    return tuple(o[1:] if o.startswith('-') else '-' + o for o in ordering)
+
+
+class KeysetPagination(BasePagination):
+    """Keyset (a.k.a. "seek") pagination over a composite, unique ordering
+
+    Unlike DRF's `CursorPagination`, which seeks on the first ordering column and then OFFSETs past ties,
+    the cursor here carries the value of *every* ordering column of the boundary row and we filter with the
+    row-wise comparison `(a, b) > (x, y)`. The cost of fetching page N is therefore the same as page 1.
+
+    The ordering must be unique (end it with `pk` if the leading columns are not), and is taken from the
+    view's `keyset_ordering` attribute when present. Querysets ordered by relevance (`IndexedSearchFilter`'s
+    `search_rank`, which isn't a column we can seek on) keep that ordering and are paged by offset instead.
+
+    Pagination is opt-in for backwards compatibility with existing API consumers: a request must supply
+    `?page_size=` or `?cursor=` to receive the paginated `{next, previous, results}` envelope, otherwise the
+    full (filtered) list is returned as before.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 100
+    max_page_size = 1000
+    ordering = ('pk',)
+    invalid_cursor_message = _('Invalid cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+
+        results = list(page_queryset)
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if self.offset is not None:
+            self.has_next, self.has_previous = has_more, self.offset > 0
+        elif self.reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.position is not None
+        return self.page
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """The unevaluated query for the requested page, or None when the request isn't paginated
+
+        It fetches one extra row, beyond the page, to learn whether there is a next page.
+        """
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = tuple(getattr(view, 'keyset_ordering', self.ordering))
+        self.pk_name = queryset.model._meta.pk.name
+        self.offset, self.position, self.reverse = None, None, False
+
+        encoded = params.get(self.cursor_query_param)
+        if queryset.query.extra_order_by:
+            self.offset = self.decode_offset(encoded) if encoded else 0
+            # `order_by()` would drop the `extra()` ordering, so repeat it, with `pk` to break ties
+            queryset = queryset.order_by(*(tuple(queryset.query.extra_order_by) + ('pk',)))
+            return queryset[self.offset:self.offset + self.page_size + 1]
+
+        if encoded:
+            self.position, self.reverse = self.decode_cursor(encoded)
+        ordering = _reverse_ordering(self.ordering) if self.reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if self.position is not None:
+            queryset = queryset.filter(self._seek_filter(ordering, self.position))
+        return queryset[:self.page_size + 1]
+
+    def get_paginated_response(self, data):
+        return RestResponse(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(size, self.max_page_size) if size > 0 else self.page_size
+
+    def get_next_link(self):
+        if not (self.has_next and self.page):
+            return None
+        if self.offset is not None:
+            return self._offset_link(self.offset + self.page_size)
+        return self._link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not (self.has_previous and self.page):
+            return None
+        if self.offset is not None:
+            return self._offset_link(max(self.offset - self.page_size, 0))
+        return self._link(self.page[0], reverse=True)
+
+    #
+    # Cursor encoding
+    #
+
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps({'p': position, 'r': int(reverse)}, separators=(',', ':'))
+        return urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, encoded):
+        payload = self._decode_payload(encoded)
+        try:
+            position, reverse = payload['p'], bool(payload.get('r'))
+        except (TypeError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_offset(self, offset):
+        payload = json.dumps({'o': offset}, separators=(',', ':'))
+        return urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def decode_offset(self, encoded):
+        payload = self._decode_payload(encoded)
+        try:
+            offset = payload['o']
+        except (TypeError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(offset, int) or offset < 0:
+            raise NotFound(self.invalid_cursor_message)
+        return offset
+
+    def _decode_payload(self, encoded):
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            return json.loads(urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    #
+    # Helpers
+    #
+
+    def _link(self, instance, reverse):
+        position = [self._column_value(instance, o.lstrip('-')) for o in self.ordering]
+        url = remove_query_param(self.base_url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position, reverse))
+
+    def _offset_link(self, offset):
+        url = remove_query_param(self.base_url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_offset(offset))
+
+    def _column_value(self, instance, attr):
+        # rows may be model instances or `values()` dicts (see `backend.fastlist`)
+        if isinstance(instance, dict):
+            value = instance[self.pk_name if attr == 'pk' else attr]
+        else:
+            value = getattr(instance, attr)
+        if isinstance(value, datetime):
+            return value.isoformat()
+        return value
+
+    @staticmethod
+    def _seek_filter(ordering, position):
+        """Expand the row-value comparison `(c1, c2, ...) > (v1, v2, ...)` into an OR of AND terms
+
+        Each column may be ascending or descending, so we can't lean on the database's native row-value
+        comparison. The leading term `c1 > v1` is index-seekable on an index matching the ordering.
+        """
+        terms = []
+        for i, order in enumerate(ordering):
+            attr = order.lstrip('-')
+            lookup = '__lt' if order.startswith('-') else '__gt'
+            term = Q(**{attr + lookup: position[i]})
+            for prev_order, prev_value in zip(ordering[:i], position[:i]):
+                term &= Q(**{prev_order.lstrip('-'): prev_value})
+            terms.append(term)
+        return reduce(lambda a, b: a | b, terms)
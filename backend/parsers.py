@@ -0,0 +1,45 @@
+import json
+
+import msgpack
+
+from django.conf import settings
+from django.utils import six
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+__all__ = 'NDJSONParser', 'MessagePackParser'
+
+
+class NDJSONParser(BaseParser):
+    """Parses newline-delimited JSON (one JSON document per line) into a list"""
+
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+
+        rows = []
+        for lineno, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rows.append(json.loads(line.decode(encoding)))
+            except ValueError as exc:
+                raise ParseError('NDJSON parse error on line %d - %s' % (lineno, six.text_type(exc)))
+        return rows
+
+
+class MessagePackParser(BaseParser):
+    """Parses a MessagePack request body, see `backend.renderers.MessagePackRenderer`"""
+
+    media_type = 'application/x-msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, TypeError, msgpack.UnpackException) as exc:
+            raise ParseError('MessagePack parse error - %s' % six.text_type(exc))
@@ -5,4 +5,4 @@ from rest_framework import permissions
 
 class AdminPermission(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        return request.user.whatever()
+        return getattr(request.user, 'is_platform_admin', False)
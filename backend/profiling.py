@@ -0,0 +1,86 @@
+"""Opt-in `cProfile` sampling of API view dispatch
+
+A request is profiled when it carries a valid signed `X-Profile` header (see `manage.py profile_stats
+--token`), or at random at the rate configured for its URL name in `PROFILE_SAMPLE_RATES`, e.g.
+`{'users-list': 0.01}`. Profiles are aggregated in memory per endpoint and written out, one `.pstats` file
+per endpoint and process, to `PROFILE_DIR` after every profiled request.
+"""
+import cProfile
+import logging
+import os
+import pstats
+import random
+import threading
+
+from django.conf import settings
+from django.core import signing
+
+
+__all__ = 'ProfilingMixin', 'make_profile_token'
+
+log = logging.getLogger(__name__)
+
+SIGNING_SALT = 'backend.profiling'
+
+_stats = {}
+_lock = threading.Lock()
+
+
+def make_profile_token():
+    """A value for the `X-Profile` request header, valid for `PROFILE_TOKEN_MAX_AGE` seconds"""
+    return signing.TimestampSigner(salt=SIGNING_SALT).sign('profile')
+
+
+def _has_valid_token(request):
+    token = request.META.get('HTTP_X_PROFILE')
+    if not token:
+        return False
+    try:
+        signing.TimestampSigner(salt=SIGNING_SALT).unsign(
+            token, max_age=getattr(settings, 'PROFILE_TOKEN_MAX_AGE', 3600))
+    except signing.BadSignature:
+        log.warning('Ignoring invalid X-Profile header on %s', request.path)
+        return False
+    return True
+
+
+def should_profile(request, endpoint):
+    rate = getattr(settings, 'PROFILE_SAMPLE_RATES', {}).get(endpoint, 0)
+    return (rate and random.random() < rate) or _has_valid_token(request)
+
+
+def record(endpoint, profiler):
+    """Fold `profiler` into this process' aggregate for `endpoint`, and write the aggregate out"""
+    directory = getattr(settings, 'PROFILE_DIR', None)
+    if not directory:
+        return
+    with _lock:
+        if endpoint in _stats:
+            _stats[endpoint].add(profiler)
+        else:
+            _stats[endpoint] = pstats.Stats(profiler)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        _stats[endpoint].dump_stats(os.path.join(directory, '%s.%d.pstats' % (endpoint, os.getpid())))
+
+
+class ProfilingMixin(object):
+    """View mixin which runs DRF's `dispatch()`, and response rendering, under `cProfile` when sampled"""
+
+    def dispatch(self, request, *args, **kwargs):
+        match = getattr(request, 'resolver_match', None)
+        endpoint = match.url_name if match else None
+        if not endpoint or not should_profile(request, endpoint):
+            return super(ProfilingMixin, self).dispatch(request, *args, **kwargs)
+
+        def run():
+            response = super(ProfilingMixin, self).dispatch(request, *args, **kwargs)
+            if hasattr(response, 'render') and callable(response.render):
+                response.render()
+            return response
+
+        profiler = cProfile.Profile()
+        response = profiler.runcall(run)
+        record(endpoint, profiler)
+        response['X-Profiled'] = endpoint
+        return response
@@ -0,0 +1,133 @@
+"""Routing of read-only API traffic to read replicas
+
+`ReplicaRouter` sends the queries of a GET or HEAD request to one of the `DATABASE_REPLICAS` aliases, and
+everything else (writes, unsafe requests, management commands, migrations) to `default`. Which requests may
+read from a replica is decided by `backend.middleware.ReplicaRoutingMiddleware`:
+
+* a client which wrote in the last `DATABASE_REPLICA_STICKY_SECONDS` reads from `default`, so it sees its own
+  writes despite replication lag. Clients are told apart by their `Authorization` header or session cookie,
+  else by address, and their last writes are remembered in the `DATABASE_REPLICA_STICKY_CACHE_ALIAS` cache,
+  which must be shared by all server processes;
+* once a request has written anything, its remaining reads go to `default` as well;
+* a replica which can't be connected to is skipped for `DATABASE_REPLICA_RETRY_SECONDS`. With no replica
+  left, reads fall back to `default`.
+
+A request sticks to the replica it first picked, so all its reads see the same snapshot.
+"""
+import hashlib
+import logging
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+
+__all__ = 'ReplicaRouter', 'get_replicas', 'read_from_replica'
+
+log = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+_local = threading.local()
+
+# replica alias -> time until which it is skipped after failing to connect
+_unavailable = {}
+_unavailable_lock = threading.Lock()
+
+
+def get_replicas():
+    return [alias for alias in getattr(settings, 'DATABASE_REPLICAS', ()) if alias in settings.DATABASES]
+
+
+def start_request(use_replica):
+    _local.use_replica = use_replica
+    _local.wrote = False
+    _local.replica = None
+
+
+def finish_request():
+    """End the request's routing; returns whether it wrote to the database"""
+    wrote = getattr(_local, 'wrote', False)
+    start_request(False)
+    return wrote
+
+
+def read_from_replica():
+    """Whether the current request has read from a replica, i.e. may have seen slightly stale data"""
+    return getattr(_local, 'replica', None) is not None
+
+
+def _is_available(alias):
+    with _unavailable_lock:
+        if _unavailable.get(alias, 0) > time.time():
+            return False
+    connection = connections[alias]
+    if connection.connection is not None:
+        return True  # `backend.db` already pings connections that sat idle too long
+    try:
+        connection.ensure_connection()
+    except DatabaseError as e:
+        log.warning('Replica %r unavailable, reading from %r instead: %s', alias, DEFAULT_DB_ALIAS, e)
+        with _unavailable_lock:
+            _unavailable[alias] = time.time() + getattr(settings, 'DATABASE_REPLICA_RETRY_SECONDS', 30)
+        return False
+    return True
+
+
+def _pick_replica():
+    if _local.replica is None:
+        candidates = get_replicas()
+        random.shuffle(candidates)
+        _local.replica = next((alias for alias in candidates if _is_available(alias)), None)
+    return _local.replica
+
+
+#
+# Read-your-writes stickiness
+#
+
+def _sticky_cache():
+    return caches[getattr(settings, 'DATABASE_REPLICA_STICKY_CACHE_ALIAS', 'default')]
+
+
+def _client_keys(request, response=None):
+    credentials = request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    keys = [credentials or request.META.get('REMOTE_ADDR', '')]
+    if response is not None and settings.SESSION_COOKIE_NAME in response.cookies:
+        keys.append(response.cookies[settings.SESSION_COOKIE_NAME].value)  # a login's follow-up requests
+    return ['replica:sticky:%s' % hashlib.md5(key.encode('utf-8')).hexdigest() for key in keys]
+
+
+def is_sticky(request):
+    return _sticky_cache().get(_client_keys(request)[0]) is not None
+
+
+def mark_sticky(request, response):
+    timeout = getattr(settings, 'DATABASE_REPLICA_STICKY_SECONDS', 5)
+    _sticky_cache().set_many({key: 1 for key in _client_keys(request, response)}, timeout)
+
+
+class ReplicaRouter(object):
+    """`DATABASE_ROUTERS` entry reading from a replica when `ReplicaRoutingMiddleware` allows it"""
+
+    def db_for_read(self, model, **hints):
+        if not getattr(_local, 'use_replica', False) or _local.wrote:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db  # related lookups follow the instance they start from
+        return _pick_replica() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _local.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # every alias holds the same data
+
+    def allow_migrate(self, db, *args, **hints):
+        # replicas receive the schema through replication
+        return db not in get_replicas()
@@ -1,10 +1,13 @@
 import logging
+from collections import Counter, OrderedDict
 
 log = logging.getLogger(__name__)
 
 from django.contrib.auth import get_user_model, authenticate
 from django.contrib.auth.models import Group
-from django.db import transaction
+from django.db import connections, router, transaction
+from django.db.models import Case, Prefetch, Value, When
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
 from rest_framework import serializers
@@ -12,8 +15,53 @@ from rest_framework import exceptions
 from rest_framework.authtoken.models import Token
 
 from .models import *
+from .instrumentation import timed
+from . import stats
 
-__all__ = 'ClientSerializer', 'UserFullSerializer', 'UserRestrictedSerializer', 'EmployeeFullSerializer'
+__all__ = 'requested_fields', 'prefetch_roles', 'ClientSerializer', 'UserFullSerializer', 'UserRestrictedSerializer', \
+          'EmployeeFullSerializer', 'EmployeeBulkSerializer'
+
+
+#
+# Sparse fieldsets
+#
+
+def requested_fields(request):
+    """Field names asked for with `?fields=a,b,c` on a read request, or None when all fields are wanted"""
+    if request is None or request.method not in ('GET', 'HEAD'):
+        return None
+    fields = request.query_params.get('fields')
+    if not fields:
+        return None
+    return frozenset(f.strip() for f in fields.split(',') if f.strip())
+
+
+class SparseFieldsMixin(object):
+    """Serializer mixin which drops every field not named in the request's `?fields=` (unknown names are ignored)"""
+
+    def __init__(self, *args, **kwargs):
+        super(SparseFieldsMixin, self).__init__(*args, **kwargs)
+        fields = requested_fields(self.context.get('request'))
+        if fields:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+
+
+#
+# Instrumentation
+#
+
+class TimedDataMixin(object):
+    """Counts the time spent producing `.data` towards the request's `serializer` timer"""
+
+    @property
+    def data(self):
+        with timed('serializer'):
+            return super(TimedDataMixin, self).data
+
+
+class TimedListSerializer(TimedDataMixin, serializers.ListSerializer):
+    pass
 
 
 #
@@ -72,9 +120,10 @@ class RestAuthLoginSerializer(serializers.Serializer):
         return attrs
 
 
-class ClientSerializer(serializers.ModelSerializer):
+class ClientSerializer(TimedDataMixin, SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Client
+        list_serializer_class = TimedListSerializer
         read_only_fields = ('created', 'modified')
         # depth = 1
 
@@ -83,14 +132,19 @@ class ClientSerializer(serializers.ModelSerializer):
 # Users
 #
 
+def prefetch_roles():
+    """`prefetch_related()` lookup for the `groups` behind `roles`, in name order like `backend.fastlist` lists them"""
+    return Prefetch('groups', queryset=Group.objects.order_by('name'))
+
 
-class UserFullSerializer(serializers.ModelSerializer):
+class UserFullSerializer(TimedDataMixin, SparseFieldsMixin, serializers.ModelSerializer):
     roles = serializers.SlugRelatedField(source='groups', slug_field='name', queryset=Group.objects,
                                          many=True, required=False,
                                          help_text='List of potential roles:  ' + ', '.join(UserRoles.valid_types))
 
     class Meta:
         model = get_user_model()
+        list_serializer_class = TimedListSerializer
         fields = (
             'email', 'password', 'phone', 'roles', 'status', 'first_name', 'last_name', 'created', 'modified')
         read_only_fields = ('created', 'modified')
@@ -121,7 +175,111 @@ class UserRestrictedSerializer(UserFullSerializer):
         read_only_fields = ('email', 'created', 'modified')
 
 
-class EmployeeFullSerializer(serializers.ModelSerializer):
+class EmployeeFullSerializer(TimedDataMixin, SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Employee
+        list_serializer_class = TimedListSerializer
         read_only_fields = ('created', 'modified')
+
+
+class EmployeeBulkListSerializer(serializers.ListSerializer):
+    """Validates a batch of Employees in one pass and creates-or-updates them, matched on `email`
+
+    Validation errors are reported per row, as a list aligned with the input. Rather than a uniqueness
+    query per row, existing emails are looked up in a single `IN` query per batch. Likewise, existing rows are
+    written with one statement per batch: `INSERT ... ON CONFLICT DO UPDATE` on PostgreSQL, an `UPDATE` with
+    a `CASE` per column elsewhere.
+    """
+    batch_size = 500
+
+    def to_internal_value(self, data):
+        rows = super(EmployeeBulkListSerializer, self).to_internal_value(data)
+
+        errors, seen = [{} for row in rows], {}
+        for i, row in enumerate(rows):
+            if row['email'] in seen:
+                errors[i] = {'email': [_('Duplicate of row %d.') % seen[row['email']]]}
+            seen.setdefault(row['email'], i)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return rows
+
+    @transaction.atomic
+    def create(self, validated_data):
+        existing = {}
+        for start in range(0, len(validated_data), self.batch_size):
+            emails = [row['email'] for row in validated_data[start:start + self.batch_size]]
+            for values in Employee.all_objects.filter(email__in=emails) \
+                    .values('pk', 'email', *stats.EMPLOYEE_FIELDS):
+                existing[values['email']] = values
+
+        # neither `bulk_create()` nor `update()` send the signals maintaining the dashboard counters
+        deltas = Counter()
+        created = [Employee(**row) for row in validated_data if row['email'] not in existing]
+        Employee.objects.bulk_create(created, batch_size=self.batch_size)
+        for employee in created:
+            deltas.update(stats.employee_keys({f: getattr(employee, f) for f in stats.EMPLOYEE_FIELDS}))
+
+        updated = [row for row in validated_data if row['email'] in existing]
+        self.update_existing(updated, existing)
+        for row in updated:
+            old = existing[row['email']]
+            deltas.subtract(stats.employee_keys(old))
+            deltas.update(stats.employee_keys(dict(old, **row)))
+        stats.adjust(deltas)
+
+        self.counts = {'created': len(created), 'updated': len(updated)}
+        return created
+
+    def update_existing(self, rows, existing):
+        # rows may set different fields, so write each set of fields separately
+        connection = connections[router.db_for_write(Employee)]
+        now = timezone.now()  # `update()` skips `auto_now`, so we stamp `modified` ourselves
+        groups = OrderedDict()
+        for row in rows:
+            groups.setdefault(tuple(sorted(name for name in row if name != 'email')), []).append(row)
+
+        for names, group in groups.items():
+            # PostgreSQL takes every column of every row as a parameter, the `CASE` two per field of a row
+            per_row = len(Employee._meta.concrete_fields) if connection.vendor == 'postgresql' else 2 * len(names) + 1
+            batch_size = min(self.batch_size, connection.ops.bulk_batch_size([None] * per_row, group) or 1)
+            for start in range(0, len(group), batch_size):
+                batch = group[start:start + batch_size]
+                if connection.vendor == 'postgresql':
+                    self.upsert(connection, names, batch, now)
+                else:
+                    Employee.all_objects.filter(pk__in=[existing[row['email']]['pk'] for row in batch]).update(
+                        modified=now, **{name: self.case(name, batch, existing) for name in names})
+
+    @staticmethod
+    def case(name, rows, existing):
+        field = Employee._meta.get_field(name)
+        return Case(*[When(pk=existing[row['email']]['pk'], then=Value(row[name], output_field=field))
+                      for row in rows], output_field=field)
+
+    @staticmethod
+    def upsert(connection, names, rows, now):
+        """`INSERT ... ON CONFLICT (email) DO UPDATE` of `rows`, overwriting only the `names` fields"""
+        opts = Employee._meta
+        qn = connection.ops.quote_name
+        fields = [f for f in opts.concrete_fields if not f.primary_key]
+        params = []
+        for row in rows:
+            # a complete row, in case the existing one was deleted in the meantime
+            employee = Employee(created=now, modified=now, **row)
+            params.extend(f.get_db_prep_save(getattr(employee, f.attname), connection) for f in fields)
+        updates = [opts.get_field(name).column for name in names + ('modified',)]
+        sql = 'INSERT INTO {0} ({1}) VALUES {2} ON CONFLICT ({3}) DO UPDATE SET {4}'.format(
+            qn(opts.db_table), ', '.join(qn(f.column) for f in fields),
+            ', '.join(['(%s)' % ', '.join(['%s'] * len(fields))] * len(rows)), qn(opts.get_field('email').column),
+            ', '.join('{0} = EXCLUDED.{0}'.format(qn(column)) for column in updates))
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+
+class EmployeeBulkSerializer(EmployeeFullSerializer):
+    """Row serializer for bulk employee writes, whose email uniqueness is checked per batch instead"""
+
+    class Meta(EmployeeFullSerializer.Meta):
+        list_serializer_class = EmployeeBulkListSerializer
+        extra_kwargs = {'email': {'validators': []}}
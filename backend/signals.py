@@ -0,0 +1,140 @@
+import logging
+
+from collections import Counter
+
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+
+from .models import *
+from .authentication import invalidate_tokens
+from .cache import bump_cache_version
+from . import stats
+from .changes import record_tombstone
+
+
+log = logging.getLogger(__name__)
+
+
+#
+# User roles
+#
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # a reverse clear (`group.user_set.clear()`) doesn't tell us which users, so look them up beforehand
+    if action == 'pre_clear' and reverse:
+        user_ids = list(User.all_objects.filter(groups=instance).values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove') and reverse:
+        user_ids = list(pk_set)
+    elif action in ('post_add', 'post_remove', 'post_clear') and not reverse:
+        user_ids = [instance.pk]
+    else:
+        return
+
+    # only the instance whose `groups` manager was used can be reset; reverse changes through
+    # `group.user_set` are picked up by the next freshly loaded User. Django doesn't drop the `groups`
+    # prefetched by e.g. `UserView.get_queryset()` either, and `roles` would be rebuilt from them.
+    if not reverse:
+        instance._roles = None
+        getattr(instance, '_prefetched_objects_cache', {}).pop('groups', None)
+    # `roles` is part of the User resource, so bump `modified` to keep ETags and Last-Modified honest
+    User.all_objects.filter(pk__in=user_ids).update(modified=timezone.now())
+    # cached tokens carry a copy of the user, roles included
+    invalidate_tokens(*Token.objects.filter(user__in=user_ids).values_list('key', flat=True))
+
+
+#
+# Token authentication cache
+#
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    invalidate_tokens(instance.key)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    # cached tokens carry a copy of the user, so any change (notably deactivation) must evict them
+    if not created:
+        invalidate_tokens(*Token.objects.filter(user=instance).values_list('key', flat=True))
+
+
+#
+# Client response cache
+#
+
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+def client_changed(sender, **kwargs):
+    # NOTE: this runs before the surrounding transaction commits, so a concurrent read can still cache the
+    # old rows under the new version; `CachedResponseMixin.response_cache_timeout` bounds that window.
+    bump_cache_version('client')
+
+
+#
+# Dashboard statistics
+#
+# Fixtures loaded with `raw=True` are not counted; run `manage.py rebuild_stats` after `loaddata`.
+#
+
+def _employee_values(instance):
+    return {field: getattr(instance, field) for field in stats.EMPLOYEE_FIELDS}
+
+
+def _adjust_stats(old_keys, new_keys):
+    deltas = Counter(new_keys)
+    deltas.subtract(old_keys)
+    stats.adjust(deltas)
+
+
+@receiver(pre_save, sender=Employee)
+def employee_stats_before(sender, instance, raw, **kwargs):
+    # the instance may have been changed in memory, so its counters are taken from the stored row
+    old = None
+    if instance.pk is not None and not raw:
+        old = Employee.all_objects.filter(pk=instance.pk).values(*stats.EMPLOYEE_FIELDS).first()
+    instance._stats_keys = stats.employee_keys(old)
+
+
+@receiver(post_save, sender=Employee)
+def employee_stats_after(sender, instance, raw, **kwargs):
+    if not raw:
+        _adjust_stats(instance._stats_keys, stats.employee_keys(_employee_values(instance)))
+
+
+@receiver(post_delete, sender=Employee)
+def employee_stats_deleted(sender, instance, **kwargs):
+    _adjust_stats(stats.employee_keys(_employee_values(instance)), [])
+
+
+@receiver(pre_save, sender=Client)
+def client_stats_before(sender, instance, raw, **kwargs):
+    old = None
+    if instance.pk and not raw:
+        old = Client.objects.filter(pk=instance.pk).values('type').first()
+    instance._stats_keys = stats.client_keys(old)
+
+
+@receiver(post_save, sender=Client)
+def client_stats_after(sender, instance, raw, **kwargs):
+    if not raw:
+        _adjust_stats(instance._stats_keys, stats.client_keys({'type': instance.type}))
+
+
+@receiver(post_delete, sender=Client)
+def client_stats_deleted(sender, instance, **kwargs):
+    _adjust_stats(stats.client_keys({'type': instance.type}), [])
+
+
+#
+# Delta sync tombstones
+#
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Employee)
+@receiver(post_delete, sender=Client)
+def row_deleted(sender, instance, **kwargs):
+    record_tombstone(sender, instance)
@@ -0,0 +1,96 @@
+"""Dashboard headcounts kept in the `StatCounter` table instead of aggregated on every request
+
+The signal handlers in `backend.signals` adjust the counters as Employees and Clients are saved and deleted.
+Code writing without model signals (`bulk_create`, `update()`, raw SQL) must call `adjust()` or `rebuild()`
+itself. Only active Employees (see `Employee.objects`) are counted.
+
+The counters are updated outside the row's own transaction, so a crash in between can leave them off by
+one; `manage.py rebuild_stats --check` compares them with a full aggregate, and `rebuild_stats` fixes them.
+"""
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from .models import Client, Employee, StatCounter
+
+
+__all__ = 'DIMENSIONS', 'EMPLOYEE_FIELDS', 'employee_keys', 'client_keys', 'adjust', 'get_stats', 'aggregate', \
+          'rebuild', 'check'
+
+DIMENSIONS = [
+    # dimension, counted rows, field
+    ('employees_by_status', lambda: Employee.objects.all(), 'status'),
+    ('employees_by_role', lambda: Employee.objects.all(), 'role'),
+    ('clients_by_type', lambda: Client.objects.all(), 'type'),
+]
+
+# what an Employee's counters depend on
+EMPLOYEE_FIELDS = ('is_active', 'status', 'role')
+
+
+def employee_keys(values):
+    """`(dimension, value)` counter keys of an Employee, given its `EMPLOYEE_FIELDS` as a dict"""
+    if not values or not values['is_active']:
+        return []
+    return [('employees_by_status', values['status']), ('employees_by_role', values['role'])]
+
+
+def client_keys(values):
+    """`(dimension, value)` counter keys of a Client, given its `type` in a dict"""
+    return [('clients_by_type', values['type'])] if values else []
+
+
+def adjust(deltas):
+    """Add `{(dimension, value): delta}` to the counters, creating missing ones"""
+    for (dimension, value), delta in sorted(deltas.items()):
+        if not delta:
+            continue
+        counters = StatCounter.objects.filter(dimension=dimension, value=value)
+        if counters.update(count=F('count') + delta):
+            continue
+        try:
+            with transaction.atomic():
+                StatCounter.objects.create(dimension=dimension, value=value, count=delta)
+        except IntegrityError:
+            # created concurrently in the meantime
+            counters.update(count=F('count') + delta)
+
+
+def get_stats():
+    """`{dimension: {value: count}}` for every dimension, leaving out values counted down to zero"""
+    stats = {dimension: {} for dimension, queryset, field in DIMENSIONS}
+    for dimension, value, count in StatCounter.objects.filter(count__gt=0) \
+            .values_list('dimension', 'value', 'count'):
+        if dimension in stats:
+            stats[dimension][value] = count
+    return stats
+
+
+def aggregate():
+    """The counters computed from scratch with a `GROUP BY` per dimension, as a `Counter`"""
+    counts = Counter()
+    for dimension, queryset, field in DIMENSIONS:
+        for value, count in queryset().order_by().values_list(field).annotate(n=Count('pk')):
+            counts[dimension, value] = count
+    return counts
+
+
+@transaction.atomic
+def rebuild():
+    """Replace every counter with a fresh aggregate; returns the number of counters written"""
+    counts = aggregate()
+    StatCounter.objects.all().delete()
+    StatCounter.objects.bulk_create([StatCounter(dimension=dimension, value=value, count=count)
+                                     for (dimension, value), count in sorted(counts.items())])
+    return len(counts)
+
+
+def check():
+    """Counters which disagree with a fresh aggregate, as `[(dimension, value, counter, actual)]`"""
+    actual = aggregate()
+    stored = Counter({(dimension, value): count for dimension, value, count in
+                      StatCounter.objects.values_list('dimension', 'value', 'count')})
+    return [(dimension, value, stored[dimension, value], actual[dimension, value])
+            for dimension, value in sorted(set(actual) | set(stored))
+            if stored[dimension, value] != actual[dimension, value]]
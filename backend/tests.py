@@ -0,0 +1,624 @@
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+import warnings
+from datetime import timedelta
+
+from django.apps import apps
+from django.contrib.auth.models import Group
+from django.core import mail
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.mail.backends.locmem import EmailBackend as LocmemBackend
+from django.conf import settings
+from django.db import connection, connections, migrations
+from django.db.migrations.autodetector import MigrationAutodetector
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.state import ProjectState
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils.six import StringIO
+from django.utils import timezone
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from .authentication import get_token_cache
+from .cache import ExpiringFileBasedCache
+from . import changes, replicas
+from .mail import OutboxEmailBackend, deliver_batch
+from .management.commands import bench_api, check_query_plans
+from .models import *
+
+
+class UserQueryBudgetTests(APITestCase):
+    """Listing or fetching users costs the same number of queries whatever the page size and roles"""
+
+    @classmethod
+    def setUpTestData(cls):
+        groups = list(Group.objects.filter(name__in=UserRoles.valid_types).order_by('name'))
+        for i in range(30):
+            user = User.objects.create_user('user%02d@pegula.io' % i, password='user')
+            user.groups.add(*groups[:i % len(groups) + 1])
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+
+    def assert_list_queries(self, path, rows, num):
+        with self.assertNumQueries(num):
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        data = response.data['results'] if 'results' in response.data else response.data
+        self.assertEqual(len(data), rows)
+        self.assertTrue(all(row['roles'] for row in data if row['email'].startswith('user')))
+
+    def test_list(self):
+        # MAX/COUNT for the ETag, the users, their roles
+        self.assert_list_queries('/api/v1/users?page_size=5', 5, 3)
+        self.assert_list_queries('/api/v1/users?page_size=25', 25, 3)
+        self.assert_list_queries('/api/v1/users', User.objects.count(), 3)
+
+    def test_detail(self):
+        # `modified` for the ETag, the user, its roles
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/v1/users/user02@pegula.io')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['roles']), 3)
+
+
+class SearchPaginationTests(APITestCase):
+    """Paginated `?search=` results stay in relevance order rather than the keyset's `email` order"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # ranked best first, but sorted the other way round by email
+        User.objects.create_user('c-quinn@pegula.io', password='user', first_name='Quinn', last_name='Quinn')
+        User.objects.create_user('b@pegula.io', password='user', first_name='Quinn', last_name='Quinn')
+        User.objects.create_user('a@pegula.io', password='user', first_name='Jo', last_name='Quinn')
+
+    def test_pages_keep_rank(self):
+        emails, url = [], '/api/v1/users?search=quinn&page_size=1'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            emails.extend(row['email'] for row in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(emails, ['c-quinn@pegula.io', 'b@pegula.io', 'a@pegula.io'])
+
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([row['email'] for row in response.data['results']], ['b@pegula.io'])
+
+
+class EmployeeBulkTests(APITestCase):
+    """Bulk writes cost the same number of queries however many existing rows they update"""
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(20):
+            Employee.objects.create(email='employee%02d@pegula.io' % i, status='Full Time', role='Engineer')
+
+    def post_rows(self, count):
+        rows = [{'email': 'employee%02d@pegula.io' % i, 'status': 'Contract', 'last_name': 'Row %d' % i}
+                for i in range(count)]
+        rows.append({'email': 'new%02d@pegula.io' % count, 'status': 'Candidate'})
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.post('/api/v1/employees/bulk', rows, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data, {'created': 1, 'updated': count})
+        # SQLite's debug cursor records `QUERY = '<sql>' - PARAMS = (...)`
+        return [re.match(r"(?:QUERY = ')?(\w+)", query['sql']).group(1)
+                for query in captured if 'backend_employee' in query['sql']]
+
+    def test_updates_are_batched(self):
+        # the rows already there, the new one, the rest
+        self.assertEqual(self.post_rows(5), ['SELECT', 'INSERT', 'UPDATE'])
+        self.assertEqual(self.post_rows(20), ['SELECT', 'INSERT', 'UPDATE'])
+        self.assertEqual(Employee.objects.filter(status='Contract').count(), 20)
+        employee = Employee.objects.get(email='employee07@pegula.io')
+        self.assertEqual((employee.last_name, employee.role), ('Row 7', 'Engineer'))
+
+
+class UserRolesTests(APITestCase):
+    """`User.roles` follows changes to `groups`, even when they had been prefetched"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('roles@pegula.io', password='user')
+        self.user.groups.add(Group.objects.get(name=UserRoles.EMPL))
+
+    def test_prefetched_groups_are_reset(self):
+        user = User.objects.prefetch_related('groups').get(pk=self.user.pk)
+        self.assertEqual(user.roles, {UserRoles.EMPL})
+        user.groups.add(Group.objects.get(name=UserRoles.ADMIN))
+        self.assertEqual(user.roles, {UserRoles.EMPL, UserRoles.ADMIN})
+        self.assertTrue(user.is_platform_admin)
+        user.groups.clear()
+        self.assertEqual(user.roles, frozenset())
+
+    def test_update_response(self):
+        response = self.client.patch('/api/v1/users/roles@pegula.io', {'roles': [UserRoles.MNG]}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['roles'], [UserRoles.MNG])
+
+
+class ConditionalListTests(APITestCase):
+    """A paginated list's ETag covers the rows of its page only"""
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(10):
+            Employee.objects.create(email='employee%02d@pegula.io' % i, status='Full Time')
+
+    def test_page_etag(self):
+        path = '/api/v1/employees?page_size=3'
+        etag = self.client.get(path)['ETag']
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        employee = Employee.objects.get(email='employee08@pegula.io')
+        employee.role = 'Engineer'
+        employee.save()
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        employee = Employee.objects.get(email='employee01@pegula.io')
+        employee.role = 'Engineer'
+        employee.save()
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_row_leaving_page(self):
+        # the row moving up is no newer than the others, so only the page's membership changes
+        Employee.objects.update(modified=timezone.now())
+        path = '/api/v1/employees?page_size=3'
+        response = self.client.get(path)
+        emails = [row['email'] for row in response.data['results']]
+        self.assertEqual(emails, ['employee00@pegula.io', 'employee01@pegula.io', 'employee02@pegula.io'])
+
+        self.assertEqual(self.client.delete('/api/v1/employees/employee01@pegula.io').status_code, 204)
+        changed = self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+        self.assertEqual([row['email'] for row in changed.data['results']],
+                         ['employee00@pegula.io', 'employee02@pegula.io', 'employee03@pegula.io'])
+
+    def test_search_page_etag(self):
+        path = '/api/v1/employees?page_size=3&search=employee'
+        response = self.client.get(path)
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        employee = Employee.objects.get(email=response.data['results'][0]['email'])
+        employee.role = 'Engineer'
+        employee.save()
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+
+class FastListTests(APITestCase):
+    """The `values()` list path renders users exactly as the serializer does"""
+
+    def test_list_matches_detail(self):
+        user = User.objects.create_user('fast@pegula.io', password='user')
+        # linked out of name order
+        user.groups.add(Group.objects.get(name=UserRoles.MNG))
+        user.groups.add(Group.objects.get(name=UserRoles.ADMIN))
+
+        detail = self.client.get('/api/v1/users/fast@pegula.io')
+        listed = self.client.get('/api/v1/users?search=fast%40pegula')
+        self.assertEqual(detail.data['roles'], [UserRoles.ADMIN, UserRoles.MNG])
+        self.assertEqual(listed.data, [detail.data])
+        self.assertEqual(list(listed.data[0]), list(detail.data))
+
+
+class QueryPlanTests(TestCase):
+    """Every list endpoint's query is served from an index (see `manage.py check_query_plans`)"""
+
+    def test_no_full_scans(self):
+        command = check_query_plans.Command()
+        command.prepare()
+        for name, queryset in command.queries():
+            with self.subTest(query=name):
+                plan = command.explain(queryset)
+                self.assertEqual(command.full_scans(plan), [], '\n'.join(plan))
+
+
+class DeactivationTests(APITestCase):
+    """Deactivated rows leave the lists but can still be fetched and reactivated"""
+
+    def test_user(self):
+        User.objects.create_user('leaver@pegula.io', password='user')
+        self.assertEqual(self.client.delete('/api/v1/users/leaver@pegula.io').status_code, 204)
+        self.assertNotIn('leaver@pegula.io', [row['email'] for row in self.client.get('/api/v1/users').data])
+        self.assertEqual(self.client.get('/api/v1/users/leaver@pegula.io').data['status'], 'deactivated')
+
+        response = self.client.patch('/api/v1/users/leaver@pegula.io', {'status': 'active'}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertIn('leaver@pegula.io', [row['email'] for row in self.client.get('/api/v1/users').data])
+
+    def test_employee(self):
+        Employee.objects.create(email='leaver@pegula.io', status='Full Time')
+        self.assertEqual(self.client.delete('/api/v1/employees/leaver@pegula.io').status_code, 204)
+        self.assertEqual(self.client.get('/api/v1/employees').data, [])
+
+        response = self.client.patch('/api/v1/employees/leaver@pegula.io', {'is_active': True}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(len(self.client.get('/api/v1/employees').data), 1)
+
+
+class UnreachableBackend(LocmemBackend):
+    def open(self):
+        raise ConnectionRefusedError('Connection refused')
+
+
+class RejectingBackend(LocmemBackend):
+    def send_messages(self, messages):
+        raise ValueError('Recipient rejected')
+
+
+class OutboxTests(TestCase):
+    """Queued email is sent by `deliver_batch`, an unreachable server doesn't use up the attempts"""
+
+    def setUp(self):
+        mail.EmailMessage('Hello', 'Body', to=['to@pegula.io'], connection=OutboxEmailBackend()).send()
+        mail.outbox = []
+
+    def test_sent(self):
+        self.assertEqual(deliver_batch(backend='django.core.mail.backends.locmem.EmailBackend'), (1, 0))
+        self.assertEqual([message.subject for message in mail.outbox], ['Hello'])
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_failed(self):
+        self.assertEqual(deliver_batch(backend='backend.tests.RejectingBackend'), (0, 1))
+        row = OutboxMessage.objects.get()
+        self.assertEqual((row.attempts, row.last_error), (1, 'ValueError: Recipient rejected'))
+        self.assertEqual(deliver_batch(backend='django.core.mail.backends.locmem.EmailBackend'), (0, 0))
+
+    def test_unreachable(self):
+        self.assertEqual(deliver_batch(backend='backend.tests.UnreachableBackend'), (0, 1))
+        row = OutboxMessage.objects.get()
+        self.assertEqual(row.attempts, 0)
+        self.assertIn('Connection refused', row.last_error)
+        self.assertGreater(row.send_after, timezone.now())
+
+
+class BatchTests(APITestCase):
+    """Sub-responses are embedded as JSON whatever `Accept` the sub-request asks for"""
+
+    def test_accept_header(self):
+        Employee.objects.create(email='batch@pegula.io', status='Full Time')
+        requests = [{'method': 'GET', 'path': 'employees/batch@pegula.io', 'headers': {'Accept': accept}}
+                    for accept in ('application/x-msgpack', 'application/json')]
+        response = self.client.post('/api/v1/batch', {'requests': requests}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual([sub['status'] for sub in response.data], [200, 200])
+        self.assertEqual(response.data[0]['body'], response.data[1]['body'])
+        self.assertEqual(response.data[0]['body']['email'], 'batch@pegula.io')
+
+
+class ImportEmployeesTests(TestCase):
+    """`manage.py import_employees` reads the usual spellings of booleans"""
+
+    def test_boolean_spellings(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write('email,status,is_active\n'
+                    'a@pegula.io,Full Time,true\n'
+                    'b@pegula.io,Full Time,No\n'
+                    'c@pegula.io,Full Time, YES\n'
+                    'd@pegula.io,Full Time,maybe\n')
+        self.addCleanup(os.remove, f.name)
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_employees', f.name, progress=0, stdout=stdout, stderr=stderr)
+        self.assertIn('4 rows read, 3 valid, 1 invalid', stdout.getvalue())
+        self.assertIn(':5: is_active:', stderr.getvalue())
+        self.assertEqual(dict(Employee.all_objects.values_list('email', 'is_active')),
+                         {'a@pegula.io': True, 'b@pegula.io': False, 'c@pegula.io': True})
+
+
+class TokenCacheTests(APITestCase):
+    """A cached token stops authenticating as soon as it is deleted or its user deactivated"""
+
+    def setUp(self):
+        get_token_cache().clear()
+        self.user = User.objects.create_user('token@pegula.io', password='user')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def get(self):
+        return self.client.get('/api/v1/users/token@pegula.io').status_code
+
+    def test_token_deleted(self):
+        self.assertEqual(self.get(), 200)
+        self.assertIsNotNone(get_token_cache().get('authtoken:' + self.token.key))
+        self.token.delete()
+        self.assertEqual(self.get(), 401)
+
+    def test_user_deactivated(self):
+        self.assertEqual(self.get(), 200)
+        self.assertIsNotNone(get_token_cache().get('authtoken:' + self.token.key))
+        self.user.deactivate()
+        self.user.save()
+        self.assertEqual(self.get(), 401)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                           'tokens': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                      'LOCATION': 'pegula-test-tokens'}},
+                   TOKEN_AUTH_CACHE_ALIAS='tokens')
+class SharedTokenCacheTests(TokenCacheTests):
+    """The same, with the tokens cached in a `CACHES` entry as in production"""
+
+
+class ResponseCacheTests(APITestCase):
+    """Writes are seen by the next GET, however they reach the database"""
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+
+    def get(self, path):
+        response = self.client.get(path)
+        # the same GET again is a cache hit
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(path).content, response.content)
+        return response
+
+    def client_names(self):
+        return {row['id']: row['name'] for row in self.get('/api/v1/clients').data}
+
+    def test_client_writes(self):
+        self.assertNotIn('acme', self.client_names())
+        response = self.client.post('/api/v1/clients', {'id': 'acme', 'name': 'Acme', 'address': '1 Road',
+                                                        'phone': '555', 'type': ClientType.TYP1}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(self.client_names()['acme'], 'Acme')
+        self.assertEqual(self.get('/api/v1/clients/acme').data['name'], 'Acme')
+
+        response = self.client.patch('/api/v1/clients/acme', {'name': 'Acme Ltd'}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.client_names()['acme'], 'Acme Ltd')
+        self.assertEqual(self.get('/api/v1/clients/acme').data['name'], 'Acme Ltd')
+
+        self.assertEqual(self.client.delete('/api/v1/clients/acme').status_code, 204)
+        self.assertNotIn('acme', self.client_names())
+        self.assertEqual(self.client.get('/api/v1/clients/acme').status_code, 404)
+
+    # employees and users aren't response-cached, but clients revalidate them with their ETags
+
+    def test_bulk_update(self):
+        Employee.objects.create(email='bulk@pegula.io', status='Full Time')
+        response = self.client.get('/api/v1/employees/bulk@pegula.io')
+        rows = [{'email': 'bulk@pegula.io', 'status': 'Contract'}]
+        self.assertEqual(self.client.post('/api/v1/employees/bulk', rows, format='json').status_code, 201)
+        for path in ('/api/v1/employees/bulk@pegula.io', '/api/v1/employees?page_size=10'):
+            changed = self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.data['results'][0]['status'], 'Contract')
+
+    def test_archive(self):
+        User.objects.create_user('leaver@pegula.io', password='user')
+        self.client.delete('/api/v1/users/leaver@pegula.io')
+        path = '/api/v1/users?include_inactive=1'
+        response = self.client.get(path)
+        self.assertIn('leaver@pegula.io', [row['email'] for row in response.data])
+
+        call_command('archive_inactive', days=0, stdout=StringIO())
+        changed = self.client.get(path, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotIn('leaver@pegula.io', [row['email'] for row in changed.data])
+        self.assertEqual(self.client.get('/api/v1/users/leaver@pegula.io').status_code, 404)
+
+
+class PercentileTests(TestCase):
+    """`manage.py bench_api` reports nearest-rank percentiles"""
+
+    def test_nearest_rank(self):
+        values = list(range(1, 21))
+        self.assertEqual([bench_api.percentile(values, pct) for pct in (0, 50, 95, 99, 100)], [1, 10, 19, 20, 20])
+        self.assertEqual(bench_api.percentile([], 95), 0)
+
+
+class ReplicaRoutingTests(APITestCase):
+    """GETs read from a replica (a second SQLite file here) unless the client just wrote or it is down"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Employee.objects.create(email='replicated@pegula.io', status='Full Time', role='Engineer')
+
+    @classmethod
+    def setUpClass(cls):
+        super(ReplicaRoutingTests, cls).setUpClass()
+        # a copy of the test database which tells its rows apart, leaving out the search tables and triggers
+        cls.tmpdir = tempfile.mkdtemp()
+        replica = sqlite3.connect(os.path.join(cls.tmpdir, 'replica.sqlite3'))
+        replica.executescript('\n'.join(sql for sql in connection.connection.iterdump() if '_fts' not in sql))
+        replica.execute("UPDATE backend_employee SET role = 'Replica'")
+        replica.commit()
+        replica.close()
+
+        databases = dict(settings.DATABASES, **{
+            'replica': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(cls.tmpdir, 'replica.sqlite3')},
+            'replica-down': {'ENGINE': 'django.db.backends.sqlite3', 'OPTIONS': {'uri': True},
+                             'NAME': 'file:%s?mode=ro' % os.path.join(cls.tmpdir, 'missing.sqlite3')},
+        })
+        for alias in ('replica', 'replica-down'):
+            connections.databases[alias] = databases[alias]
+        cls.databases_override = override_settings(DATABASES=databases, DATABASE_REPLICA_STICKY_SECONDS=0.5)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')  # overriding DATABASES is fine as `connections` knows the aliases
+            cls.databases_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.databases_override.disable()
+        for alias in ('replica', 'replica-down'):
+            connections[alias].close()
+            del connections.databases[alias]
+        shutil.rmtree(cls.tmpdir)
+        super(ReplicaRoutingTests, cls).tearDownClass()
+
+    def setUp(self):
+        caches['default'].clear()
+        replicas._unavailable.clear()
+
+    def role(self):
+        return self.client.get('/api/v1/employees/replicated@pegula.io').data['role']
+
+    def test_reads_from_replica(self):
+        with self.settings(DATABASE_REPLICAS=['replica']):
+            self.assertEqual(self.role(), 'Replica')
+        self.assertEqual(self.role(), 'Engineer')
+
+    def test_sticky_after_write(self):
+        with self.settings(DATABASE_REPLICAS=['replica']):
+            response = self.client.patch('/api/v1/employees/replicated@pegula.io', {'role': 'Lead'}, format='json')
+            self.assertEqual(response.status_code, 200, response.data)
+            self.assertEqual(self.role(), 'Lead')
+            time.sleep(0.6)
+            self.assertEqual(self.role(), 'Replica')
+
+    def test_fallback(self):
+        with self.settings(DATABASE_REPLICAS=['replica-down', 'replica']):
+            for i in range(5):
+                self.assertEqual(self.role(), 'Replica')
+            self.assertIn('replica-down', replicas._unavailable)
+
+        with self.settings(DATABASE_REPLICAS=['replica-down']):
+            self.assertEqual(self.role(), 'Engineer')
+
+
+class ExpiringFileBasedCacheTests(TestCase):
+    """Culling the file cache drops expired entries and keeps live ones"""
+
+    def test_cull(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        cache = ExpiringFileBasedCache(location, {'OPTIONS': {'MAX_ENTRIES': 4, 'CULL_FREQUENCY': 1}})
+        cache.set('live', 1, 60)
+        for i in range(3):
+            cache.set('expired%d' % i, 1, 0.01)
+        time.sleep(0.02)
+        cache.set('new', 1, 60)
+        self.assertEqual((cache.get('live'), cache.get('new')), (1, 1))
+        self.assertEqual(len(cache._list_cache_files()), 2)
+
+
+class MigrationStateTests(TestCase):
+    """The managers recorded by the migrations are the ones `makemigrations` derives from the models"""
+
+    def test_managers(self):
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        changes = MigrationAutodetector(loader.project_state(), ProjectState.from_apps(apps)).changes(loader.graph)
+        self.assertEqual([operation.describe() for migration in changes.get('backend', [])
+                          for operation in migration.operations
+                          if isinstance(operation, migrations.AlterModelManagers)], [])
+
+
+class StatCounterTests(APITestCase):
+    """The counters behind `/api/v1/stats` agree with a full aggregate after every kind of write"""
+
+    def assert_consistent(self):
+        # raises CommandError listing the counters which are off
+        call_command('rebuild_stats', check=True, stdout=StringIO())
+
+    def test_employee_writes(self):
+        self.assert_consistent()
+        for i in range(4):
+            response = self.client.post('/api/v1/employees', {'email': 'stats%d@pegula.io' % i, 'status': 'Full Time',
+                                                               'role': 'Engineer'}, format='json')
+            self.assertEqual(response.status_code, 201, response.data)
+        self.assert_consistent()
+
+        self.client.patch('/api/v1/employees/stats0@pegula.io', {'role': 'Lead', 'status': 'Contract'}, format='json')
+        self.assert_consistent()
+        self.client.patch('/api/v1/employees/stats1@pegula.io', {'is_active': False}, format='json')
+        self.assert_consistent()
+        self.client.patch('/api/v1/employees/stats1@pegula.io', {'is_active': True}, format='json')
+        self.assert_consistent()
+
+        self.assertEqual(self.client.delete('/api/v1/employees/stats2@pegula.io').status_code, 204)
+        self.assert_consistent()
+        Employee.objects.get(email='stats3@pegula.io').delete()
+        self.assert_consistent()
+
+        rows = [{'email': 'stats0@pegula.io', 'status': 'Candidate'},
+                {'email': 'stats1@pegula.io', 'status': 'Full Time', 'is_active': False},
+                {'email': 'stats9@pegula.io', 'status': 'Full Time', 'role': 'Engineer'}]
+        response = self.client.post('/api/v1/employees/bulk', rows, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assert_consistent()
+
+        call_command('archive_inactive', days=0, stdout=StringIO())
+        self.assertFalse(Employee.all_objects.filter(email__in=['stats1@pegula.io', 'stats2@pegula.io']).exists())
+        self.assert_consistent()
+
+    def test_client_writes(self):
+        Client.objects.create(id='stats', name='Stats', type=ClientType.TYP1)
+        self.assert_consistent()
+        self.client.patch('/api/v1/clients/stats', {'type': ClientType.TYP2}, format='json')
+        self.assert_consistent()
+        self.client.delete('/api/v1/clients/stats')
+        self.assert_consistent()
+
+
+@override_settings(CHANGES_SETTLE_SECONDS=0)
+class ChangesTests(APITestCase):
+    """`/changes` hands out every change once, deletions included, and only to valid tokens"""
+
+    def poll(self, since=None):
+        response = self.client.get('/api/v1/changes', {'since': since} if since else {})
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def drain(self, since=None):
+        data = self.poll(since)
+        while data['more']:
+            data = self.poll(data['since'])
+        return data['since']
+
+    def test_later_changes_only(self):
+        Employee.objects.create(email='before@pegula.io', status='Full Time')
+        since = self.drain()
+        Employee.objects.create(email='after@pegula.io', status='Full Time')
+        data = self.poll(since)
+        self.assertEqual([row['email'] for row in data['changed']['employees']], ['after@pegula.io'])
+        self.assertEqual((data['changed']['users'], data['changed']['clients']), ([], []))
+        self.assertEqual(self.poll(data['since'])['changed']['employees'], [])
+
+    def test_deletions(self):
+        Client.objects.create(id='gone', name='Gone', type=ClientType.TYP1)
+        Employee.objects.create(email='leaver@pegula.io', status='Full Time')
+        user = User.objects.create_user('archived@pegula.io', password='user')
+        user.deactivate()
+        user.save()
+        since = self.drain()
+
+        Client.objects.get(id='gone').delete()
+        self.assertEqual(self.client.delete('/api/v1/employees/leaver@pegula.io').status_code, 204)
+        call_command('archive_inactive', days=0, only='users', stdout=StringIO())
+        data = self.poll(since)
+        self.assertIn('gone', data['deleted']['clients'])
+        self.assertIn('leaver@pegula.io', data['deleted']['employees'])
+        self.assertIn('archived@pegula.io', data['deleted']['users'])
+        self.assertEqual(data['changed'], {'users': [], 'employees': [], 'clients': []})
+
+    def test_rejected_tokens(self):
+        response = self.client.get('/api/v1/changes', {'since': 'not-a-token'})
+        self.assertEqual(response.status_code, 400)
+        future = (timezone.now() + timedelta(hours=1)).isoformat()
+        response = self.client.get('/api/v1/changes', {'since': changes.encode_token({'employees': [future, 1]})})
+        self.assertEqual(response.status_code, 400)
+
+    def test_same_timestamp_across_pages(self):
+        since = self.drain()
+        for email in ('tie1@pegula.io', 'tie2@pegula.io'):
+            Employee.objects.create(email=email, status='Full Time')
+        Employee.objects.filter(email__startswith='tie').update(modified=timezone.now())
+
+        emails = []
+        with self.settings(CHANGES_PAGE_SIZE=1):
+            data = self.poll(since)
+            emails += [row['email'] for row in data['changed']['employees']]
+            self.assertTrue(data['more'])
+            data = self.poll(data['since'])
+            emails += [row['email'] for row in data['changed']['employees']]
+        self.assertEqual(emails, ['tie1@pegula.io', 'tie2@pegula.io'])
@@ -1,13 +1,35 @@
+import hashlib
 import logging
+from calendar import timegm
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
 
 from rest_framework import viewsets
 from rest_framework import routers
-from rest_framework.decorators import detail_route
+from rest_framework.decorators import detail_route, list_route
+from rest_framework.parsers import JSONParser
+from rest_framework import status as http_status
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response as RestResponse
-from rest_framework.filters import SearchFilter
 
 from .models import *
 from .serializers import *
+from .pagination import KeysetPagination
+from .filters import IndexedSearchFilter, SparseFieldsFilter
+from .parsers import MessagePackParser, NDJSONParser
+from .renderers import StreamingJSONRenderer
+from .export import EXPORT_FORMATS, iter_chunks, iter_queryset_chunks, stream_export
+from .cache import get_response_cache, get_cache_version, seconds_since_bump
+from .fastlist import compile_plan
+from .instrumentation import timed
+from .profiling import ProfilingMixin
+from .replicas import read_from_replica
+from .stats import get_stats
+from .changes import get_changes
+from .batch import parse_batch, run_batch
 
 
 __all__ = 'frontpage', 'router'
@@ -17,13 +39,245 @@ log = logging.getLogger(__name__)
 
 # RESTful Web Service Endpoints
 
-class ClientView(viewsets.ModelViewSet):
+def include_inactive(view):
+    """Whether the view's queryset includes deactivated rows
+
+    Detail actions always do, so that e.g. a deactivated user can be fetched and reactivated. Lists (and their
+    searches and exports) only when asked for, with `?include_inactive=1` or by filtering on `?status=`.
+    """
+    if view.action not in ('list', 'export'):
+        return True
+    params = view.request.query_params
+    return params.get('include_inactive', '').lower() in ('1', 'true', 'yes') or bool(params.get('status'))
+
+
+class ExportMixin(object):
+    """Adds an `export` list route streaming the (filtered) queryset as CSV or NDJSON"""
+    export_fields = ()
+    export_chunk_size = 2000
+
+    @list_route(methods=['get'])
+    def export(self, request):
+        """Stream every matching record as CSV (default) or NDJSON
+
+        ---
+        parameters:
+          - name: as
+            paramType: query
+            description: Optional output format, `csv` or `ndjson`
+        """
+        fmt = request.query_params.get('as', 'csv')
+        if fmt not in EXPORT_FORMATS:
+            raise ValidationError({'as': ['Must be one of: ' + ', '.join(sorted(EXPORT_FORMATS))]})
+        queryset = self.filter_queryset(self.get_queryset())
+        filename = str(queryset.model._meta.verbose_name_plural)
+        return stream_export(self.export_rows(queryset), self.get_export_header(), fmt, filename)
+
+    def get_export_header(self):
+        return self.export_fields
+
+    def export_rows(self, queryset):
+        for chunk in iter_chunks(queryset, self.export_fields, self.export_chunk_size):
+            for row in chunk:
+                yield row[1:]
+
+
+class ConditionalGetMixin(object):
+    """Adds `ETag`/`Last-Modified` to list and detail GETs, and answers matching conditional GETs with 304
+
+    Validators come from the `TimestampedModel.modified` column: for a paginated list, the `(pk, modified)`
+    pairs of the requested page's rows, so a row leaving the page changes the ETag too; `MAX(modified)` and
+    `COUNT(*)` of the filtered queryset for an unpaginated one; the row's `modified` for details. A 304 never
+    loads or serializes a model.
+    """
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        get_page_queryset = getattr(self.paginator, 'get_page_queryset', None)
+        page = get_page_queryset(queryset, request, view=self) if get_page_queryset else None
+        if page is not None:
+            # at most `page_size + 1` rows; not a subquery, which `extra()` SQL naming the table can't be part of
+            rows = list(page.values_list('pk', 'modified'))
+            last_modified = max(modified for pk, modified in rows) if rows else None
+            members = hashlib.md5(repr(rows).encode('utf-8')).hexdigest()
+        else:
+            stats = queryset.order_by().aggregate(last_modified=Max('modified'), count=Count('pk'))
+            last_modified, members = stats['last_modified'], stats['count']
+        return self.conditional_response(
+            request, last_modified, (request.get_full_path(), members),
+            lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        modified = self.filter_queryset(self.get_queryset()).prefetch_related(None) \
+            .filter(**{self.lookup_field: lookup}).values_list('modified', flat=True).first()
+        if modified is None:
+            # missing row: let the normal path produce the 404
+            return super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs)
+        return self.conditional_response(
+            request, modified, (request.get_full_path(),),
+            lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs))
+
+    def conditional_response(self, request, last_modified, tag_parts, respond):
+        tag = '%s|%s|%s' % ('|'.join(str(p) for p in tag_parts),
+                            last_modified.isoformat() if last_modified else '',
+                            request.accepted_renderer.media_type)
+        etag = hashlib.md5(tag.encode('utf-8')).hexdigest()
+        last_modified = timegm(last_modified.utctimetuple()) if last_modified else None
+
+        if self.is_not_modified(request, etag, last_modified):
+            response = RestResponse(status=http_status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = respond()
+        if response.status_code in (200, 304):
+            response['ETag'] = quote_etag(etag)
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    @staticmethod
+    def is_not_modified(request, etag, last_modified):
+        # If-None-Match takes precedence over If-Modified-Since (RFC 7232 section 6)
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            etags = parse_etags(if_none_match)
+            return etag in etags or '*' in etags
+        if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        return bool(if_modified_since and last_modified is not None and last_modified <= if_modified_since)
+
+
+class CachedResponseMixin(object):
+    """Serves list and detail GETs from rendered bytes cached under a per-model version token
+
+    `backend.signals` bumps the `response_cache_namespace` version whenever a row is saved or deleted,
+    which orphans every cached response at once. Browsable API pages are user-specific and never cached.
+    Must come before `ConditionalGetMixin` so cache hits can still be answered with a 304.
+    """
+    response_cache_namespace = None
+    response_cache_timeout = 300
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super(CachedResponseMixin, self).list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, super(CachedResponseMixin, self).retrieve, *args, **kwargs)
+
+    def cached_response(self, request, respond, *args, **kwargs):
+        if request.accepted_renderer.format == 'api':
+            return respond(request, *args, **kwargs)
+
+        cache = get_response_cache()
+        key = 'api:%s:%s:%s:%s' % (self.response_cache_namespace, get_cache_version(self.response_cache_namespace),
+                                   request.accepted_media_type, hashlib.md5(
+                                       request.get_full_path().encode('utf-8')).hexdigest())
+        entry = cache.get(key)
+        if entry is not None:
+            if ConditionalGetMixin.is_not_modified(request, entry['etag'], entry['last_modified']):
+                response = HttpResponse(status=http_status.HTTP_304_NOT_MODIFIED)
+            else:
+                response = HttpResponse(entry['content'], content_type=entry['content_type'])
+            for header in ('ETag', 'Last-Modified'):
+                if entry['headers'].get(header):
+                    response[header] = entry['headers'][header]
+            return response
+
+        response = respond(request, *args, **kwargs)
+        if response.status_code == 200 and self.may_cache_response():
+            self.finalize_response(request, response, *args, **kwargs).render()
+            cache.set(key, {
+                'content': response.content,
+                'content_type': response['Content-Type'],
+                'etag': parse_etags(response['ETag'])[0] if response.has_header('ETag') else None,
+                'last_modified': parse_http_date_safe(response.get('Last-Modified', '')),
+                'headers': {h: response[h] for h in ('ETag', 'Last-Modified') if response.has_header(h)},
+            }, self.response_cache_timeout)
+        return response
+
+    def may_cache_response(self):
+        # a replica may not have caught up with the write which last bumped the version yet, and caching what
+        # it returned would pin stale data under the new version
+        if not read_from_replica():
+            return True
+        since = seconds_since_bump(self.response_cache_namespace)
+        return since is None or since > getattr(settings, 'DATABASE_REPLICA_STICKY_SECONDS', 5)
+
+
+class FastListMixin(object):
+    """Serves `list` from `values()` rows through a plan compiled from the serializer (see `backend.fastlist`)
+
+    Produces the same output as the serializer without building model instances. Falls back to the regular
+    `list` when the serializer has fields the plan can't express.
+    """
+
+    def list(self, request, *args, **kwargs):
+        plan = compile_plan(self.get_serializer(many=True).child)
+        if plan is None:
+            return super(FastListMixin, self).list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+        # pagination reads the ordering columns; extra selects (e.g. search rank) must stay for ORDER BY
+        names = set(plan.fetch) | {queryset.model._meta.pk.name} | set(queryset.query.extra)
+        names |= {o.lstrip('-') for o in getattr(self, 'keyset_ordering', ()) if o.lstrip('-') != 'pk'}
+        rows = queryset.values(*names)
+
+        page = self.paginate_queryset(rows)
+        with timed('serializer'):
+            data = plan.serialize(page if page is not None else rows)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return RestResponse(data)
+
+
+class StreamingListMixin(object):
+    """Streams unpaginated `list` responses chunk by chunk when `StreamingJSONRenderer` was negotiated
+
+    Rows are fetched and serialized `stream_chunk_size` at a time, through the `backend.fastlist` plan when
+    the serializer compiles to one, so neither the first byte nor memory use wait for the whole list. Must
+    come after `ConditionalGetMixin`, which still answers conditional GETs from the aggregate alone.
+    """
+    stream_chunk_size = 500
+
+    def list(self, request, *args, **kwargs):
+        if not isinstance(request.accepted_renderer, StreamingJSONRenderer) or self.pagination_requested(request):
+            return super(StreamingListMixin, self).list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        plan = compile_plan(self.get_serializer(many=True).child)
+        if plan is not None:
+            names = set(plan.fetch) | {queryset.model._meta.pk.name} | set(queryset.query.extra)
+            queryset = queryset.prefetch_related(None).values(*names)
+
+        def serialize(rows):
+            return plan.serialize(rows) if plan is not None else self.get_serializer(rows, many=True).data
+
+        chunks = (serialize(rows) for rows in iter_queryset_chunks(queryset, self.stream_chunk_size))
+        renderer = request.accepted_renderer
+        return StreamingHttpResponse(renderer.render_chunks(chunks, self.get_renderer_context()),
+                                     content_type=renderer.media_type)
+
+    def pagination_requested(self, request):
+        paginator = self.paginator
+        return paginator is not None and any(
+            getattr(paginator, name, None) in request.query_params
+            for name in ('cursor_query_param', 'page_size_query_param', 'page_query_param'))
+
+
+class ClientView(ProfilingMixin, CachedResponseMixin, ConditionalGetMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = Client.objects.all()
     serializer_class = ClientSerializer
     lookup_field = 'id'
 
+    # the slug `id` never changes, unlike `modified`, which would move an edited client to another page
+    pagination_class = KeysetPagination
+    keyset_ordering = ('id',)
 
-class UserView(viewsets.ModelViewSet):
+    response_cache_namespace = 'client'
+
+    filter_backends = (SparseFieldsFilter,)
+
+
+class UserView(ProfilingMixin, ConditionalGetMixin, StreamingListMixin, FastListMixin, ExportMixin,
+               viewsets.ModelViewSet):
     """Basic service for creating and updating Users
 
     ---
@@ -31,19 +285,37 @@ class UserView(viewsets.ModelViewSet):
       parameters:
         - name: search
           paramType: query
-          description: Optional search query, performs substring match on `email`, `first_name`, and `last_name`
+          description: Optional search query, performs substring match on `email`, `first_name`, and `last_name`, best matches first
         - name: status
           paramType: query
           description: Optional filter, value must be `active` or `deactivated`
+        - name: include_inactive
+          paramType: query
+          description: Optional, set to `1` to include deactivated users, which are otherwise left out unless filtering by `status`
+        - name: page_size
+          paramType: query
+          description: Optional, enables cursor pagination and returns `next`, `previous` and `results`
+        - name: cursor
+          paramType: query
+          description: Optional, opaque cursor taken from a previous page's `next` or `previous` link
+        - name: fields
+          paramType: query
+          description: Optional comma separated list of fields to return, e.g. `email,first_name,last_name`
     """
     queryset = User.objects.all()
     serializer_class = UserFullSerializer
     lookup_field = 'email'
     lookup_value_regex = '[^@]+@[^@]+\.[^@]+'  # DRF DefaultRouter regex splits on '.' character, so we must supply custom URL regex for email
 
-    filter_backends = (SearchFilter,)
+    filter_backends = (IndexedSearchFilter, SparseFieldsFilter)
     search_fields = ('email', 'first_name', 'last_name')
 
+    # `email` is unique and indexed, and unlike `modified` it doesn't change under a client paging through
+    pagination_class = KeysetPagination
+    keyset_ordering = ('email',)
+
+    export_fields = ('email', 'phone', 'status', 'first_name', 'last_name', 'created', 'modified')
+
     def get_serializer_class(self):
         # We route between serializers to ensure that "updates" can't change username, org, password
         if self.request.method in ('GET', 'POST'):
@@ -55,12 +327,28 @@ class UserView(viewsets.ModelViewSet):
     def get_queryset(self):
         # We use this strategy for rather than `rest_framework.filters.DjangoFilterBackend` so
         # that we can _also_ use `SearchFilter`. There may be some better way to use them in tandem.
-        queryset = self.queryset
+        # `roles` is serialized from `groups`, so fetch them all in one query rather than one per user.
+        queryset = User.all_objects if include_inactive(self) else self.queryset
+        queryset = queryset.prefetch_related(prefetch_roles())
         status = self.request.query_params.get('status', None)
         if status:
             queryset = queryset.filter(status=status)
         return queryset
 
+    def get_export_header(self):
+        return self.export_fields + ('roles',)
+
+    def export_rows(self, queryset):
+        # `roles` isn't a column, so look up group names for each chunk of users in one extra query
+        memberships = User.groups.through.objects
+        for chunk in iter_chunks(queryset, self.export_fields, self.export_chunk_size):
+            roles = {}
+            for user_id, name in memberships.filter(user_id__in=[row[0] for row in chunk]) \
+                    .values_list('user_id', 'group__name'):
+                roles.setdefault(user_id, []).append(name)
+            for row in chunk:
+                yield row[1:] + (roles.get(row[0], []),)
+
     def perform_destroy(self, user):
         # hook into HTTP DELETE verb such that we mark status=deactivated
         # override the `destroy()` method if we need full control over HTTP response, etc.
@@ -68,15 +356,23 @@ class UserView(viewsets.ModelViewSet):
         user.save()
 
 
-class EmployeeView(viewsets.ModelViewSet):
+class EmployeeView(ProfilingMixin, ConditionalGetMixin, StreamingListMixin, FastListMixin, ExportMixin,
+                   viewsets.ModelViewSet):
     queryset = Employee.objects.all()
     serializer_class = EmployeeFullSerializer
     lookup_field = 'email'
     lookup_value_regex = '[^@]+@[^@]+\.[^@]+'  # DRF DefaultRouter regex splits on '.' character, so we must supply custom URL regex for email
 
-    filter_backends = (SearchFilter,)
+    filter_backends = (IndexedSearchFilter, SparseFieldsFilter)
     search_fields = ('email', 'first_name', 'last_name')
 
+    # `email` is unique and indexed, and unlike `modified` it doesn't change under a client paging through
+    pagination_class = KeysetPagination
+    keyset_ordering = ('email',)
+
+    export_fields = ('email', 'phone', 'role', 'status', 'is_active', 'first_name', 'last_name',
+                     'date_from', 'date_to', 'created', 'modified')
+
     def get_serializer_class(self):
         # We route between serializers to ensure that "updates" can't change username, org, password
         if self.request.method in ('GET', 'POST', 'PUT', 'PATCH'):
@@ -86,7 +382,7 @@ class EmployeeView(viewsets.ModelViewSet):
     def get_queryset(self):
         # We use this strategy for rather than `rest_framework.filters.DjangoFilterBackend` so
         # that we can _also_ use `SearchFilter`. There may be some better way to use them in tandem.
-        queryset = self.queryset
+        queryset = Employee.all_objects.all() if include_inactive(self) else self.queryset.all()
         status = self.request.query_params.get('status', None)
         if status:
             queryset = queryset.filter(status=status)
@@ -98,8 +394,66 @@ class EmployeeView(viewsets.ModelViewSet):
         user.deactivate()
         user.save()
 
+    @list_route(methods=['post'], parser_classes=(JSONParser, NDJSONParser, MessagePackParser))
+    def bulk(self, request):
+        """Create or update many Employees at once, matched on `email`
+
+        Accepts a JSON array, NDJSON with `Content-Type: application/x-ndjson`, or a MessagePack array. All
+        rows are written in a single transaction, or none are: on validation failure the response is a list of
+        errors aligned with the submitted rows.
+        """
+        serializer = EmployeeBulkSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return RestResponse(serializer.counts, status=http_status.HTTP_201_CREATED)
+
+
+class StatsView(viewsets.ViewSet):
+    """Dashboard headcounts: active employees by `status` and by `role`, and clients by `type`
+
+    Served from counters maintained as rows change (see `backend.stats`), not aggregated per request.
+    """
+
+    def list(self, request):
+        return RestResponse(get_stats())
+
+
+class ChangesView(viewsets.ViewSet):
+    """Users, Employees and Clients changed since the last poll, for keeping a local copy in sync
+
+    Returns `changed` rows and the keys of `deleted` (or deactivated) ones per resource, and a `since` token
+    for the next poll. Keep polling straight away while `more` is true.
+
+    ---
+    list:
+      parameters:
+        - name: since
+          paramType: query
+          description: The `since` token returned by the previous poll; leave out to start with every row
+    """
+
+    def list(self, request):
+        return RestResponse(get_changes(request, request.query_params.get('since')))
+
+
+class BatchView(viewsets.ViewSet):
+    """Runs several API requests in one round trip, e.g. everything a page needs to load
+
+    POST `{"requests": [{"method": "GET", "path": "/users?status=active"}, ...], "parallel": true}`. Paths
+    are relative to `/api/v1`; writes take a JSON `body`, and any sub-request may add `headers` such as
+    `If-None-Match`. The response lists `{status, headers, body}` for each request, in order. Sub-requests are
+    authenticated as the batch request, and with `parallel` a batch of GETs runs concurrently.
+    """
+
+    def create(self, request):
+        items, parallel = parse_batch(request.data)
+        return RestResponse(run_batch(request, items, parallel))
+
 
 router = routers.DefaultRouter(trailing_slash=False)
 router.register(r'clients', ClientView, 'clients')
 router.register(r'users', UserView, 'users')
 router.register(r'employees', EmployeeView, 'employees')
+router.register(r'stats', StatsView, 'stats')
+router.register(r'changes', ChangesView, 'changes')
+router.register(r'batch', BatchView, 'batch')
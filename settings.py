@@ -49,6 +49,8 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'backend.middleware.QueryInstrumentationMiddleware',  # first, so its `total` timing covers the rest
+    'backend.middleware.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -60,6 +62,14 @@ MIDDLEWARE_CLASSES = (
     'django.middleware.security.SecurityMiddleware'
 )
 
+# Requests running the same SQL statement this many times get a "duplicate query" warning logged
+INSTRUMENTATION_DUPLICATE_QUERY_THRESHOLD = 5
+
+# On-demand cProfile sampling of API views (see `backend.profiling`), keyed by URL name, e.g. `users-list`
+PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+PROFILE_SAMPLE_RATES = {}  # e.g. {'users-list': 0.01}
+PROFILE_TOKEN_MAX_AGE = 3600  # seconds a signed `X-Profile` header stays valid
+
 ROOT_URLCONF = 'urls'
 
 TEMPLATES = [
@@ -88,17 +98,91 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'pegula.sqlite3'),
+        'CONN_MAX_AGE': 600,
     }
 }
 
+# Read replicas (see `backend.replicas`): every alias but `default` serves the reads of GET/HEAD requests.
+# To try it locally, copy the database and point `PEGULA_REPLICA_DB` at the copy, which is opened read-only:
+#   $> cp pegula.sqlite3 pegula-replica.sqlite3 && PEGULA_REPLICA_DB=pegula-replica.sqlite3 ./manage.py runserver
+if os.environ.get('PEGULA_REPLICA_DB'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': 'file:%s?mode=ro' % os.path.join(BASE_DIR, os.environ['PEGULA_REPLICA_DB']),
+        'OPTIONS': {'uri': True},
+        'CONN_MAX_AGE': 600,
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['backend.replicas.ReplicaRouter']
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_REPLICA_STICKY_SECONDS = 5  # a client reads from `default` for this long after writing
+DATABASE_REPLICA_STICKY_CACHE_ALIAS = 'default'
+DATABASE_REPLICA_RETRY_SECONDS = 30  # a replica which failed to connect is skipped for this long
+
+# Persistent connections idle for longer than this many seconds are pinged before reuse (see `backend.db`)
+DB_HEALTH_CHECK_IDLE = 30
+
+# Caches
+# https://docs.djangoproject.com/en/1.8/topics/cache/
+# `api` holds rendered API responses (see `backend.views.CachedResponseMixin`); it must be shared by
+# all server processes in production so that version bumps reach every worker.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'api': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pegula-api',
+    },
+}
+API_RESPONSE_CACHE_ALIAS = 'api'
+
+# `/api/v1/batch` (see `backend.batch`): sub-requests per batch, and threads running parallel batches
+BATCH_MAX_REQUESTS = 20
+BATCH_MAX_WORKERS = 4
+
+# Email is queued in the `OutboxMessage` table and delivered by `manage.py send_outbox` (see `backend.mail`)
+# through `OUTBOX_DELIVERY_BACKEND`. During development that prints to the console; to try SMTP delivery
+# against a local stand-in, run `python -m smtpd -n -c DebuggingServer localhost:1025` and
+# `./manage.py send_outbox --backend django.core.mail.backends.smtp.EmailBackend`.
+EMAIL_BACKEND = 'backend.mail.OutboxEmailBackend'
+OUTBOX_DELIVERY_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_DELAY = 60  # seconds before the first retry, doubled on each further failure
+OUTBOX_MAX_RETRY_DELAY = 3600
+OUTBOX_CLAIM_TIMEOUT = 600  # seconds before messages claimed by a worker that died are sent again
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 1025))
+EMAIL_TIMEOUT = 30  # a stalled server fails the attempt instead of blocking the worker for good
+
 # Django REST Auth utilizes Django REST Framework's `TokenAuthentication` scheme
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'backend.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
+    # `Accept: application/x-msgpack` for compact responses, `application/stream+json` to stream long lists
+    'DEFAULT_RENDERER_CLASSES': (
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'backend.renderers.MessagePackRenderer',
+        'backend.renderers.StreamingJSONRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        'backend.parsers.MessagePackParser',
+    ),
     'TEST_REQUEST_DEFAULT_FORMAT': 'json',
 }
+
+# `CachedTokenAuthentication` keeps token -> user lookups in a per-process LRU by default. Point
+# `TOKEN_AUTH_CACHE_ALIAS` at a shared `CACHES` entry so invalidation reaches every uWSGI worker.
+TOKEN_AUTH_CACHE_ALIAS = None
+TOKEN_AUTH_CACHE_SIZE = 10000
+TOKEN_AUTH_CACHE_TIMEOUT = 60  # seconds
+
 REST_AUTH_SERIALIZERS = {
     'TOKEN_SERIALIZER': 'backend.serializers.AuthTokenSerializer',
     'USER_DETAILS_SERIALIZER': 'backend.serializers.UserFullSerializer',
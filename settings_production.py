@@ -28,9 +28,47 @@ DATABASES = {
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD', 'INSECURE_Ye3P8FLwaL'),
         'HOST':     'authdb',  # Docker configures /etc/hosts when we link containers
         'PORT':     os.environ.get('AUTHDB_PORT_5432_TCP_PORT', '5432'),
+        # keep each uWSGI worker's connection open between requests, but recycle it every 10 minutes
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)),
     }
 }
 
+# Streaming replicas of `authdb`, e.g. AUTHDB_REPLICA_HOSTS=authdb-replica1,authdb-replica2
+for i, host in enumerate(filter(None, os.environ.get('AUTHDB_REPLICA_HOSTS', '').split(','))):
+    DATABASES['replica%d' % (i + 1)] = dict(DATABASES['default'], HOST=host.strip(), TEST={'MIRROR': 'default'})
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+
+# Ping a persistent connection before reusing it if it sat idle this long (see `backend.db`)
+DB_HEALTH_CHECK_IDLE = 30
+
+# Share the API response cache between the uWSGI workers on this host. Every page, cursor and query
+# string is an entry, hence the room above Django's default of 300.
+CACHES['api'] = {
+    'BACKEND': 'backend.cache.ExpiringFileBasedCache',
+    'LOCATION': '/var/tmp/pegula-api-cache',
+    'OPTIONS': {'MAX_ENTRIES': 20000},
+}
+# Read-your-writes stickiness must be seen by every worker. Its markers get a cache of their own, so
+# culling the responses can't drop them: a client whose marker is lost reads its writes back stale.
+CACHES['replica-sticky'] = {
+    'BACKEND': 'backend.cache.ExpiringFileBasedCache',
+    'LOCATION': '/var/tmp/pegula-replica-sticky',
+    'OPTIONS': {'MAX_ENTRIES': 10000},
+}
+DATABASE_REPLICA_STICKY_CACHE_ALIAS = 'replica-sticky'
+# Token lookups too, or deleting a token or deactivating its user would only evict it from one worker
+CACHES['tokens'] = {
+    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+    'LOCATION': '/var/tmp/pegula-token-cache',
+    'TIMEOUT': TOKEN_AUTH_CACHE_TIMEOUT,
+    'OPTIONS': {'MAX_ENTRIES': TOKEN_AUTH_CACHE_SIZE},
+}
+TOKEN_AUTH_CACHE_ALIAS = 'tokens'
+
+# Queued email is delivered by a `manage.py send_outbox --loop` worker
+OUTBOX_DELIVERY_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 25))
+
 
 # Enforce SSL connections exclusively (unless our gateway is doing SSL termination?)
 CSRF_COOKIE_SECURE = False